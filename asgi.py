@@ -0,0 +1,18 @@
+"""
+Asynchronous Server Gateway Interface (ASGI) entry point
+
+Serve it with uvicorn workers under gunicorn, installed by the asgi extra:
+    poetry install --extras asgi
+    gunicorn -k uvicorn.workers.UvicornWorker asgi:app
+"""
+import os
+from service.asgi import AsyncWishlistService
+
+PORT = int(os.getenv("PORT", "8000"))
+
+app = AsyncWishlistService()
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host="0.0.0.0", port=PORT)
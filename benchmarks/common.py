@@ -0,0 +1,55 @@
+"""
+Helpers shared by the benchmarks
+
+Every benchmark times its runs with time_runs(), reports them with
+summarize() and writes its results as JSON with write_results(), so the
+results of all of them can be read and compared the same way.
+"""
+import json
+import statistics
+import sys
+import time
+
+
+def time_runs(function, repeat, setup=None, warm_up=0) -> list:
+    """Returns how many milliseconds each of repeat calls of a function took
+
+    Args:
+        function (callable): called with what setup returned, or the number of the run
+        repeat (int): the runs to time
+        setup (callable): called with the number of the run before it, and not timed
+        warm_up (int): runs before the timed ones, whose times are thrown away
+    """
+    timings = []
+    for run in range(warm_up + repeat):
+        argument = setup(run) if setup else run
+        started = time.perf_counter()
+        function(argument)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings[warm_up:]
+
+
+def percentile(values, fraction):
+    """Returns the value under which a fraction of the sorted values are"""
+    return values[max(int(len(values) * fraction) - 1, 0)]
+
+
+def summarize(timings) -> dict:
+    """Returns the median, 95th percentile and worst of some latencies in milliseconds"""
+    timings = sorted(timings)
+    return {
+        "median_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(percentile(timings, 0.95), 3),
+        "max_ms": round(timings[-1], 3),
+    }
+
+
+def write_results(results, output=None):
+    """Writes the results as JSON to a file, or prints them"""
+    if output:
+        with open(output, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+            file.write("\n")
+        return
+    json.dump(results, sys.stdout, indent=2)
+    print()
@@ -0,0 +1,102 @@
+"""
+Serialization Benchmark for reading a Wishlist
+
+Seeds a Wishlist with --items items in the database named by DATABASE_URI
+and times the two ways of turning it into a JSON body, each with the
+standard library and the orjson encoder:
+
+    orm   Wishlist.find() with its items joined, then Wishlist.serialize()
+    core  Wishlist.find_row() and Item.find_rows_by_wishlist_id(), then
+          Wishlist.serialize_row(), without building any ORM instances
+
+The results are printed as JSON. Everything runs in one transaction that
+is rolled back, so the seeded rows never become visible to anyone else.
+
+Usage:
+    DATABASE_URI=sqlite:// python -m benchmarks.serialization --items 1000
+"""
+import argparse
+import sys
+from datetime import date
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import insert
+from wsgi import app
+from benchmarks.common import summarize, time_runs, write_results
+from service.common.json_provider import OrjsonProvider, orjson
+from service.models import db, Wishlist, Item
+
+
+def seed(session, items):
+    """Inserts a Wishlist holding some items and returns its id"""
+    wishlist_id = session.execute(
+        insert(Wishlist.__table__)
+        .values(
+            user_id=1,
+            title="Benchmark",
+            description="seeded by benchmarks.serialization",
+            count=items,
+            date=date.today(),
+        )
+        .returning(Wishlist.__table__.c.id)
+    ).scalar_one()
+    session.execute(
+        insert(Item.__table__),
+        [{"wishlist_id": wishlist_id, "item_name": f"item {n}"} for n in range(items)],
+    )
+    return wishlist_id
+
+
+def orm_payload(wishlist_id):
+    """Builds the payload of a Wishlist from ORM instances"""
+    return Wishlist.find(wishlist_id).serialize()
+
+
+def core_payload(wishlist_id):
+    """Builds the payload of a Wishlist straight from Core rows"""
+    return Wishlist.serialize_row(
+        Wishlist.find_row(wishlist_id), Item.find_rows_by_wishlist_id(wishlist_id)
+    )
+
+
+def measure(build, encode, wishlist_id, repeat):
+    """Returns the latency of a path in milliseconds"""
+
+    def start_over(_):
+        # start every run from an empty identity map, as a request would
+        db.session.expunge_all()
+
+    return summarize(time_runs(lambda _: encode(build(wishlist_id)), repeat, start_over))
+
+
+def run(items, repeat):
+    """Seeds the database, times every path and returns the results"""
+    encoders = {"stdlib": DefaultJSONProvider(app)}
+    if orjson is not None:
+        encoders["orjson"] = OrjsonProvider(app)
+    paths = {"orm": orm_payload, "core": core_payload}
+    results = {"database": db.engine.dialect.name, "items": items, "paths": []}
+    try:
+        wishlist_id = seed(db.session, items)
+        for path, build in paths.items():
+            for encoder, provider in encoders.items():
+                timing = measure(build, provider.dumps, wishlist_id, repeat)
+                results["paths"].append({"path": path, "encoder": encoder, **timing})
+    finally:
+        db.session.rollback()
+    return results
+
+
+def main(argv=None):
+    """Parses the command line and prints the results as JSON"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--items", type=int, default=1000, help="items in the wishlist")
+    parser.add_argument("--repeat", type=int, default=200, help="runs of each path")
+    args = parser.parse_args(argv)
+    with app.app_context():
+        results = run(args.items, args.repeat)
+    write_results(results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
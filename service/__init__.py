@@ -5,10 +5,21 @@ This module creates and configures the Flask app and sets up the logging
 and SQL database
 """
 
+import os
 import sys
+import threading
+import time
 from flask import Flask
 from service import config
 from service.common import log_handlers
+from service.common.assets import init_assets
+from service.common.cache import cache
+from service.common.compression import init_compression
+from service.common.json_provider import init_json
+from service.common.metrics import metrics
+from service.common.pool import init_pool
+from service.common.profiling import profiler
+from service.common.slow_queries import slow_queries
 
 
 ############################################################
@@ -16,29 +27,53 @@ from service.common import log_handlers
 ############################################################
 def create_app():
     """Initialize the core application."""
+    marks = [("start", time.perf_counter())]
     # Create Flask application
     app = Flask(__name__)
     app.config.from_object(config)
+    init_json(app)
+    init_pool(app)
+    marks.append(("app", time.perf_counter()))
 
     # Initialize Plugins
     # pylint: disable=import-outside-toplevel
-    from service.models import db
+    from service.models import db, replicas, check_schema
 
+    marks.append(("models", time.perf_counter()))
     db.init_app(app)
+    replicas.init_app(app)
+    cache.init_app(app)
+    # registered before compression so that the total includes it
+    metrics.init_app(app)
+    metrics.add_source(cache.samples)
+    profiler.init_app(app)
+    init_compression(app)
+    init_assets(app)
+    marks.append(("plugins", time.perf_counter()))
 
     with app.app_context():
         # Dependencies require we import the routes AFTER the Flask app is created
         # pylint: disable=wrong-import-position, wrong-import-order, unused-import
         from service import routes
-        from service.models import item, wishlist  # noqa: F401 E402
+        from service.models import item, wishlist, duplicate_job  # noqa: F401 E402
         from service.common import error_handlers, cli_commands  # noqa: F401, E402
+        marks.append(("routes", time.perf_counter()))
+        slow_queries.init_app(app, db.engines.values())
 
-        try:
-            db.create_all()
-        except Exception as error:  # pylint: disable=broad-except
-            app.logger.critical("%s: Cannot continue", error)
-            # gunicorn requires exit code 4 to stop spawning workers when they die
-            sys.exit(4)
+        if os.environ.get("FLASK_RUN_FROM_CLI") == "true":
+            # `flask db-migrate` has to load the app to fix the very schema
+            # the check refuses, so commands leave it to `flask run` requests
+            check_schema_on_first_request(app, check_schema)
+            version = None
+        else:
+            try:
+                # only the primary holds the schema; the replicas copy it
+                version = check_schema(app)
+            except Exception as error:  # pylint: disable=broad-except
+                app.logger.critical("%s: Cannot continue", error)
+                # gunicorn requires exit code 4 to stop spawning workers when they die
+                sys.exit(4)
+        marks.append(("schema", time.perf_counter()))
 
         # Set up logging for production
         log_handlers.init_logging(app, "gunicorn.error")
@@ -49,6 +84,33 @@ def create_app():
         )
         app.logger.info(70 * "*")
 
-        app.logger.info("Service initialized!")
+        app.extensions["startup"] = startup_times(marks)
+        if version is not None:
+            app.logger.info("Schema version: %d", version)
+        app.logger.info("Service initialized in %s", app.extensions["startup"])
 
         return app
+
+
+def check_schema_on_first_request(app, check_schema):
+    """Checks the schema before the first request rather than at startup"""
+    lock = threading.Lock()
+    checked = []
+
+    def check_once():
+        with lock:
+            if not checked:
+                app.logger.info("Schema version: %d", check_schema(app))
+                checked.append(True)
+
+    app.before_request(check_once)
+
+
+def startup_times(marks) -> dict:
+    """Returns how many milliseconds every step of create_app took, and in total"""
+    times = {
+        f"{name}_ms": round((end - start) * 1000, 1)
+        for (_, start), (name, end) in zip(marks, marks[1:])
+    }
+    times["total_ms"] = round((marks[-1][1] - marks[0][1]) * 1000, 1)
+    return times
@@ -0,0 +1,328 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Asynchronous Wishlist Service
+
+This module serves the wishlist and item endpoints of service.routes as
+an ASGI application, with an AsyncSession over the async psycopg driver,
+so a worker keeps answering other requests while its queries wait on
+the database. It shares the models, their validation and serialization,
+their finders and their version tracking with the WSGI service.
+
+The create, read, update, delete and list endpoints are served, with the
+same keyset pagination, list filters, sparse fieldsets and ETags, parsed
+by service.common.query_args for both. Streaming, search, batches,
+duplication and the payload cache are only served by the WSGI service.
+"""
+import json
+import logging
+from urllib.parse import parse_qsl
+from sqlalchemy import select
+from sqlalchemy.orm import load_only
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from werkzeug.datastructures import Headers, MultiDict
+from werkzeug.exceptions import BadRequest, HTTPException, NotFound, UnsupportedMediaType
+from werkzeug.http import parse_etags, quote_etag
+from werkzeug.routing import Map, Rule
+from service import config
+from service.common import status
+from service.common.cache_channel import PostgresChannel
+from service.common.json_provider import orjson
+from service.common.query_args import filter_wishlists, get_page_args, get_projection_args, next_page_link
+from service.models import DataValidationError, Item, Wishlist
+
+logger = logging.getLogger("flask.app")
+
+
+######################################################################
+#  R E Q U E S T S   A N D   R E S P O N S E S
+######################################################################
+class Request:
+    """The parts of an ASGI HTTP request that the endpoints read"""
+
+    def __init__(self, scope, body: bytes):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.args = MultiDict(parse_qsl(scope.get("query_string", b"").decode(), keep_blank_values=True))
+        self.headers = Headers([(name.decode("latin-1"), value.decode("latin-1")) for name, value in scope["headers"]])
+        self.body = body
+        self.host = self.headers.get("Host", "localhost")
+        self.scheme = scope.get("scheme", "http")
+
+    @property
+    def base_url(self) -> str:
+        """Returns the URL of the request without its query string, as Flask does"""
+        return f"{self.scheme}://{self.host}{self.path}"
+
+    def get_json(self):
+        """Returns the JSON body of the request, which must be application/json"""
+        content_type = self.headers.get("Content-Type", "")
+        if content_type.split(";")[0].strip() != "application/json":
+            raise UnsupportedMediaType("Content-Type must be application/json")
+        try:
+            return json.loads(self.body)
+        except ValueError as error:
+            raise BadRequest(f"Invalid JSON body: {error}") from error
+
+    def etag_matches(self, etag) -> bool:
+        """Returns whether the If-None-Match header holds an ETag, compared weakly"""
+        return parse_etags(self.headers.get("If-None-Match")).contains_weak(etag)
+
+
+def dumps(payload) -> bytes:
+    """Encodes a payload as JSON, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload).encode()
+
+
+def make_etag(record_id, version):
+    """Returns the strong ETag of a version of a record, as the WSGI service does"""
+    return f"{record_id}-{version}"
+
+
+######################################################################
+#  W I S H L I S T   E N D P O I N T S
+######################################################################
+async def health_check(service, session, request):  # pylint: disable=unused-argument
+    """Let them know our heart is still beating"""
+    return status.HTTP_200_OK, {"status": 200, "message": "Healthy"}, {}
+
+
+async def list_wishlists(service, session, request):  # pylint: disable=unused-argument
+    """Returns a page of the Wishlists that match the filters of the query string"""
+    fields, include = get_projection_args(request, Wishlist)
+    limit, after = get_page_args(request, config.PAGINATION_MAX_LIMIT, config.PAGINATION_DEFAULT_LIMIT)
+    query = select(Wishlist).options(*Wishlist.list_loader_options(include))
+    if fields is not None:
+        query = query.options(load_only(*(getattr(Wishlist, field) for field in fields)))
+    query = Wishlist.paginate(filter_wishlists(request, query), limit, after)
+    wishlists = (await session.scalars(query)).unique().all()
+    results = [wishlist.serialize(fields, "items" in include) for wishlist in wishlists]
+    return status.HTTP_200_OK, results, next_page_link(request, results, limit)
+
+
+async def create_wishlists(service, session, request):
+    """Creates a Wishlist from the body of the request"""
+    wishlist = Wishlist().deserialize(request.get_json())
+    session.add(wishlist)
+    await service.commit(session, wishlist.cache_keys())
+    location = service.url_for(request, get_wishlists, wishlist_id=wishlist.id)
+    logger.info("Wishlist with ID: %d created.", wishlist.id)
+    return status.HTTP_201_CREATED, wishlist.serialize(), {"Location": location}
+
+
+async def get_wishlists(service, session, request, wishlist_id):  # pylint: disable=unused-argument
+    """Returns a Wishlist with its items, built from Core rows"""
+    row = (await session.execute(Wishlist.select_row(wishlist_id))).first()
+    if row is None:
+        raise NotFound(f"Wishlist with id '{wishlist_id}' was not found.")
+    etag = make_etag(wishlist_id, row.version)
+    if request.etag_matches(etag):
+        return status.HTTP_304_NOT_MODIFIED, None, {"ETag": quote_etag(etag)}
+    item_rows = await session.execute(Item.select_rows_by_wishlist_id(wishlist_id))
+    payload = Wishlist.serialize_row(row, item_rows)
+    return status.HTTP_200_OK, payload, {"ETag": quote_etag(etag)}
+
+
+async def update_wishlists(service, session, request, wishlist_id):
+    """Updates a Wishlist from the body of the request"""
+    data = request.get_json()
+    wishlist = await session.get(Wishlist, wishlist_id, options=Wishlist.get_loader_options())
+    if wishlist is None:
+        raise NotFound(f"Wishlist with id: '{wishlist_id}' was not found.")
+    wishlist.deserialize(data)
+    await service.commit(session, wishlist.cache_keys())
+    return status.HTTP_200_OK, wishlist.serialize(), {}
+
+
+async def delete_wishlists(service, session, request, wishlist_id):  # pylint: disable=unused-argument
+    """Deletes a Wishlist if it exists"""
+    wishlist = await session.get(Wishlist, wishlist_id, options=Wishlist.get_loader_options())
+    if wishlist is not None:
+        stale_keys = wishlist.cache_keys()
+        await session.delete(wishlist)
+        await service.commit(session, stale_keys)
+    return status.HTTP_204_NO_CONTENT, None, {}
+
+
+######################################################################
+#  I T E M   E N D P O I N T S
+######################################################################
+async def list_items(service, session, request, wishlist_id):  # pylint: disable=unused-argument
+    """Returns a page of the Items of a Wishlist"""
+    version = await session.scalar(select(Wishlist.version).where(Wishlist.id == wishlist_id))
+    if version is None:
+        raise NotFound(f"Wishlist with id '{wishlist_id}' could not be found.")
+    limit, after = get_page_args(request, config.PAGINATION_MAX_LIMIT, config.PAGINATION_DEFAULT_LIMIT)
+    etag = make_etag(wishlist_id, version)
+    if request.etag_matches(etag):
+        return status.HTTP_304_NOT_MODIFIED, None, {"ETag": quote_etag(etag)}
+    query = Item.paginate(Item.find_by_wishlist_id(wishlist_id, select(Item)), limit, after)
+    results = [item.serialize() for item in await session.scalars(query)]
+    headers = {"ETag": quote_etag(etag), **next_page_link(request, results, limit)}
+    return status.HTTP_200_OK, results, headers
+
+
+async def create_wishlist_items(service, session, request, wishlist_id):
+    """Adds an Item to a Wishlist"""
+    data = request.get_json()
+    wishlist = await session.get(Wishlist, wishlist_id, options=Wishlist.get_loader_options())
+    if wishlist is None:
+        raise NotFound(f"Wishlist with id '{wishlist_id}' could not be found.")
+    item = Item().deserialize(data)
+    wishlist.items.append(item)
+    await service.commit(session, wishlist.cache_keys())
+    return status.HTTP_201_CREATED, item.serialize(), {}
+
+
+async def get_items(service, session, request, wishlist_id, item_id):  # pylint: disable=unused-argument
+    """Returns an Item, built from its Core row"""
+    row = (await session.execute(Item.select_row(item_id))).first()
+    if row is None:
+        raise NotFound(f"Wishlist with id '{item_id}' could not be found.")
+    etag = make_etag(item_id, row.version)
+    if request.etag_matches(etag):
+        return status.HTTP_304_NOT_MODIFIED, None, {"ETag": quote_etag(etag)}
+    return status.HTTP_200_OK, Item.serialize_row(row), {"ETag": quote_etag(etag)}
+
+
+async def update_item(service, session, request, wishlist_id, item_id):  # pylint: disable=unused-argument
+    """Updates an Item from the body of the request"""
+    data = request.get_json()
+    item = await session.get(Item, item_id)
+    if item is None:
+        raise NotFound(f"Wishlist with id '{item_id}' could not be found.")
+    item.deserialize(data)
+    await service.commit(session, item.cache_keys())
+    return status.HTTP_200_OK, item.serialize(), {}
+
+
+async def delete_items(service, session, request, wishlist_id, item_id):  # pylint: disable=unused-argument
+    """Deletes an Item if it exists"""
+    item = await session.get(Item, item_id)
+    if item is not None:
+        stale_keys = item.cache_keys()
+        await session.delete(item)
+        await service.commit(session, stale_keys)
+    return status.HTTP_204_NO_CONTENT, None, {}
+
+
+URL_MAP = Map(
+    [
+        Rule("/health", endpoint=health_check, methods=["GET"]),
+        Rule("/wishlists", endpoint=list_wishlists, methods=["GET"]),
+        Rule("/wishlists", endpoint=create_wishlists, methods=["POST"]),
+        Rule("/wishlists/<int:wishlist_id>", endpoint=get_wishlists, methods=["GET"]),
+        Rule("/wishlists/<int:wishlist_id>", endpoint=update_wishlists, methods=["PUT"]),
+        Rule("/wishlists/<int:wishlist_id>", endpoint=delete_wishlists, methods=["DELETE"]),
+        Rule("/wishlists/<int:wishlist_id>/items", endpoint=list_items, methods=["GET"]),
+        Rule("/wishlists/<int:wishlist_id>/items", endpoint=create_wishlist_items, methods=["POST"]),
+        Rule("/wishlists/<int:wishlist_id>/items/<int:item_id>", endpoint=get_items, methods=["GET"]),
+        Rule("/wishlists/<int:wishlist_id>/items/<int:item_id>", endpoint=update_item, methods=["PUT"]),
+        Rule("/wishlists/<int:wishlist_id>/items/<int:item_id>", endpoint=delete_items, methods=["DELETE"]),
+    ]
+)
+
+
+######################################################################
+#  A S G I   A P P L I C A T I O N
+######################################################################
+class AsyncWishlistService:
+    """ASGI application that serves the wishlist and item endpoints"""
+
+    def __init__(self, database_uri=None):
+        database_uri = database_uri or config.DATABASE_URI
+        self.engine = create_async_engine(database_uri, **config.engine_options(database_uri))
+        # the payloads are serialized after the commit, from what was loaded
+        self.sessions = async_sessionmaker(self.engine, expire_on_commit=False)
+        self.channel = None
+        if config.CACHE_INVALIDATION_CHANNEL:
+            # the caches of the WSGI workers still hear about every write
+            self.channel = PostgresChannel(database_uri, config.CACHE_INVALIDATION_CHANNEL)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self.handle(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        """Disposes of the connection pool when the server shuts down"""
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                logger.info("Async wishlist service running")
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.engine.dispose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def handle(self, scope, receive, send):
+        """Answers one HTTP request"""
+        body = b""
+        more_body = True
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+        request = Request(scope, body)
+        try:
+            endpoint, values = URL_MAP.bind(request.host).match(request.path, request.method)
+            async with self.sessions() as session:
+                code, payload, headers = await endpoint(self, session, request, **values)
+        except HTTPException as error:
+            code, payload, headers = error_response(error.code, error.name, str(error))
+        except DataValidationError as error:
+            code, payload, headers = error_response(status.HTTP_400_BAD_REQUEST, "Bad Request", str(error))
+        except Exception as error:  # pylint: disable=broad-except
+            logger.exception("Internal Server Error")
+            code, payload, headers = error_response(status.HTTP_500_INTERNAL_SERVER_ERROR, "Internal Server Error", str(error))
+        await respond(send, code, payload, headers)
+
+    async def commit(self, session, stale_keys):
+        """Commits a session, telling the WSGI workers which payloads went stale"""
+        try:
+            if self.channel is not None and stale_keys:
+                await session.run_sync(self.channel.publish, stale_keys)
+            await session.commit()
+        except Exception as error:
+            await session.rollback()
+            logger.error("Error committing: %s", error)
+            raise DataValidationError(error) from error
+
+    def url_for(self, request, endpoint, **values):
+        """Returns the external URL of an endpoint"""
+        return URL_MAP.bind(request.host, url_scheme=request.scheme).build(endpoint, values, force_external=True)
+
+
+async def respond(send, code, payload, headers):
+    """Sends a response with a JSON body, or without a body when the payload is None"""
+    content = b"" if payload is None else dumps(payload)
+    raw_headers = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers.items()]
+    if payload is not None:
+        raw_headers.append((b"content-type", b"application/json"))
+    raw_headers.append((b"content-length", str(len(content)).encode()))
+    await send({"type": "http.response.start", "status": code, "headers": raw_headers})
+    await send({"type": "http.response.body", "body": content})
+
+
+def error_response(code, name, message):
+    """Returns the JSON error of a status code, like the WSGI error handlers"""
+    logger.warning(message)
+    return code, {"status": code, "error": name, "message": message}, {}
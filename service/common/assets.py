@@ -0,0 +1,137 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Static Asset Fingerprinting
+
+This module copies the static assets to names that hold a hash of their
+content, under static/dist, and writes a manifest of those names. The
+index page refers to the hashed copies, which never change and so are
+cached for a year, while the page itself is revalidated with its ETag.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+from flask import current_app, request
+from service.common.compression import send_static_file
+
+# the folder, inside the static folder, that holds the hashed copies
+DIST = "dist"
+MANIFEST = "manifest.json"
+INDEX = "index.html"
+# the static references of the index page, as in href="static/js/rest_api.js"
+REFERENCE = re.compile(r'((?:href|src)\s*=\s*")static/([^"]+)(")')
+
+
+def init_assets(app):
+    """Serves the hashed copies of the static assets and the index page"""
+    app.view_functions["static"] = send_asset
+    load_assets(app)
+
+
+def load_assets(app):
+    """Loads the manifest and renders the index page that refers to it"""
+    manifest = load_manifest(app.static_folder)
+    with open(os.path.join(app.static_folder, INDEX), "rb") as source:
+        page = rewrite_references(source.read().decode(), manifest).encode()
+    app.extensions["assets"] = {
+        "manifest": manifest,
+        "hashed": set(manifest.values()),
+        "index": page,
+        "etag": hashlib.sha256(page).hexdigest()[:16],
+    }
+    if manifest:
+        app.logger.info("Serving %d fingerprinted static assets", len(manifest))
+
+
+def load_manifest(folder) -> dict:
+    """Returns the manifest in a static folder, or {} when it was not built"""
+    path = os.path.join(folder, DIST, MANIFEST)
+    if not os.path.isfile(path):
+        return {}
+    with open(path, encoding="utf-8") as source:
+        return json.load(source)
+
+
+def rewrite_references(page: str, manifest: dict) -> str:
+    """Points the static references of a page at their hashed copies"""
+    return REFERENCE.sub(
+        lambda match: f'{match[1]}static/{manifest.get(match[2], match[2])}{match[3]}', page
+    )
+
+
+def send_asset(filename):
+    """Sends a static file, caching hashed copies for good"""
+    response = send_static_file(filename)
+    if filename in current_app.extensions["assets"]["hashed"]:
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config["STATIC_IMMUTABLE_MAX_AGE"]
+        response.cache_control.immutable = True
+    return response
+
+
+def send_index():
+    """Sends the index page, which browsers must revalidate before reuse"""
+    assets = current_app.extensions["assets"]
+    response = current_app.response_class(assets["index"], mimetype="text/html")
+    response.set_etag(assets["etag"])
+    response.cache_control.max_age = current_app.config["STATIC_INDEX_MAX_AGE"]
+    response.cache_control.must_revalidate = True
+    return response.make_conditional(request)
+
+
+######################################################################
+#  B U I L D I N G   T H E   M A N I F E S T
+######################################################################
+def fingerprint(path: str, data: bytes) -> str:
+    """Returns a path with the hash of its content before the extension"""
+    stem, extension = os.path.splitext(path)
+    return f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{extension}"
+
+
+def build_manifest(folder) -> dict:
+    """Copies the static assets to hashed names and writes their manifest
+
+    The index page, and the compressed copies of files, are left out.
+    Hashed copies of an earlier build are removed first.
+
+    Returns:
+        dict: the hashed path of every asset, by its path in the folder
+    """
+    dist = os.path.join(folder, DIST)
+    shutil.rmtree(dist, ignore_errors=True)
+    os.makedirs(dist)
+    manifest = {}
+    for root, folders, filenames in os.walk(folder):
+        if root == folder:
+            folders.remove(DIST)
+        for filename in filenames:
+            if filename == INDEX or os.path.splitext(filename)[1] in (".gz", ".br"):
+                continue
+            path = os.path.join(root, filename)
+            name = os.path.relpath(path, folder).replace(os.sep, "/")
+            with open(path, "rb") as source:
+                data = source.read()
+            manifest[name] = f"{DIST}/{fingerprint(name, data)}"
+            target = os.path.join(folder, manifest[name])
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with open(target, "wb") as copy:
+                copy.write(data)
+    with open(os.path.join(dist, MANIFEST), "w", encoding="utf-8") as target:
+        json.dump(manifest, target, indent=2, sort_keys=True)
+    return manifest
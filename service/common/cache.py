@@ -0,0 +1,173 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Payload Cache
+
+This module contains a bounded, in-process LRU cache with a time to live
+that holds the serialized payloads of records keyed by (table, id)
+
+A reader that missed can read a record just before a write commits and
+cache it just after the write invalidated it. Every invalidation counts
+a generation, so a reader takes the generation before it reads the
+database and the cache drops what it sets if anything was invalidated
+in between
+"""
+import threading
+import time
+from collections import OrderedDict
+from service.common.cache_channel import PostgresChannel
+
+
+class PayloadCache:
+    """Least recently used cache of serialized records with a time to live"""
+
+    def __init__(self, max_entries=1000, ttl=60.0, enabled=False):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled = enabled
+        self.channel = None
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def init_app(self, app):
+        """Configures the cache from the settings of a Flask app"""
+        self.enabled = app.config["CACHE_ENABLED"]
+        self.max_entries = app.config["CACHE_MAX_ENTRIES"]
+        self.ttl = app.config["CACHE_TTL"]
+        self.detach()
+        self.clear()
+        self.hits = self.misses = self.evictions = 0
+        channel_name = app.config["CACHE_INVALIDATION_CHANNEL"]
+        if self.enabled and channel_name:
+            self.attach(PostgresChannel(listen_uri(app.config), channel_name))
+
+    def attach(self, channel):
+        """Shares invalidations with the caches of other processes over a channel"""
+        self.channel = channel
+        channel.subscribe(self.invalidate, self.clear)
+
+    def detach(self):
+        """Stops sharing invalidations with other processes"""
+        if self.channel is not None:
+            self.channel.close()
+            self.channel = None
+
+    def get(self, key):
+        """Returns the value cached under a key, or None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                    self.evictions += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def generation(self) -> int:
+        """Returns the count of invalidations, to take before reading what is to be cached"""
+        with self._lock:
+            return self._generation
+
+    def set(self, key, value, generation=None):
+        """Caches a value under a key, evicting the least recently used entry
+
+        Args:
+            key (tuple): the (table, id) of the record
+            value: what to cache
+            generation (int): the generation taken before the value was read,
+                which nothing is cached for when an invalidation came since
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def publish(self, session, keys):
+        """Tells the other processes to invalidate keys once the session commits"""
+        if self.channel is not None and keys:
+            self.channel.publish(session, keys)
+
+    def invalidate(self, *keys):
+        """Removes the values cached under the given keys"""
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        """Removes every value"""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def samples(self) -> list:
+        """Returns the counters and size of the cache as (metric, labels, value) for /metrics"""
+        if not self.enabled:
+            return []
+        stats = self.stats()
+        return [
+            ("cache_hits_total", (), stats["hits"]),
+            ("cache_misses_total", (), stats["misses"]),
+            ("cache_evictions_total", (), stats["evictions"]),
+            ("cache_entries", (), stats["size"]),
+        ]
+
+    def stats(self) -> dict:
+        """Returns the size of the cache and its hit, miss and eviction counters"""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+def listen_uri(config) -> str:
+    """Returns the URI of the database to LISTEN for invalidations on
+
+    Raises:
+        ValueError: when the connections go through PgBouncer and no direct
+            CACHE_CHANNEL_URI was given, as a transaction pooler drops LISTEN
+    """
+    if config["CACHE_CHANNEL_URI"]:
+        return config["CACHE_CHANNEL_URI"]
+    if config["DB_CONNECTION_MODE"] == "pgbouncer":
+        raise ValueError(
+            "CACHE_CHANNEL_URI must name the database directly when DB_CONNECTION_MODE is pgbouncer"
+        )
+    return config["SQLALCHEMY_DATABASE_URI"]
+
+
+cache = PayloadCache()
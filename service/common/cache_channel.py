@@ -0,0 +1,124 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Cache Invalidation Channel
+
+This module carries cache invalidation events between gunicorn workers and
+replicas over PostgreSQL LISTEN/NOTIFY, so that a write on one pod evicts
+the stale payloads cached by every other pod
+"""
+import json
+import logging
+import select
+import threading
+import psycopg
+from psycopg import sql
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+
+logger = logging.getLogger("flask.app")
+
+# NOTIFY payloads must stay under 8000 bytes
+KEYS_PER_NOTIFICATION = 200
+
+
+class PostgresChannel:
+    """Publishes and listens for invalidated cache keys on a NOTIFY channel"""
+
+    def __init__(self, database_uri: str, name: str, poll_interval: float = 1.0):
+        url = make_url(database_uri).set(drivername="postgresql")
+        self.conninfo = url.render_as_string(hide_password=False)
+        self.name = name
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def publish(self, session, keys) -> None:
+        """Queues a notification that is delivered when the session commits
+
+        Args:
+            session (Session): the session of the transaction that changes the keys
+            keys (list): the (table, id) cache keys to invalidate
+        """
+        keys = [list(key) for key in keys]
+        for start in range(0, len(keys), KEYS_PER_NOTIFICATION):
+            payload = json.dumps(keys[start:start + KEYS_PER_NOTIFICATION])
+            session.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {"channel": self.name, "payload": payload},
+            )
+
+    def subscribe(self, on_keys, on_reconnect) -> None:
+        """Starts a daemon thread that listens for notifications
+
+        Args:
+            on_keys (callable): called with the keys of each notification
+            on_reconnect (callable): called after the listener had to reconnect,
+                since notifications sent while it was away are lost
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._listen,
+            args=(on_keys, on_reconnect),
+            name=f"listen-{self.name}",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def close(self) -> None:
+        """Stops the listener thread"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _listen(self, on_keys, on_reconnect) -> None:
+        """Listens for notifications until the channel is closed"""
+        connected_before = False
+        while not self._stop.is_set():
+            try:
+                with psycopg.connect(
+                    self.conninfo, autocommit=True, application_name=f"listen-{self.name}"
+                ) as conn:
+                    conn.add_notify_handler(
+                        lambda notify: on_keys(*decode_keys(notify.payload))
+                    )
+                    conn.execute(sql.SQL("LISTEN {}").format(sql.Identifier(self.name)))
+                    if connected_before:
+                        on_reconnect()
+                    connected_before = True
+                    self._poll(conn)
+            except Exception as error:  # pylint: disable=broad-except
+                logger.warning("Cache invalidation listener failed: %s", error)
+                self._stop.wait(self.poll_interval)
+
+    def _poll(self, conn) -> None:
+        """Delivers notifications as they arrive on a listening connection"""
+        while not self._stop.is_set():
+            ready, _, _ = select.select([conn.fileno()], [], [], self.poll_interval)
+            if ready:
+                # any statement makes psycopg dispatch the pending notifications
+                conn.execute("SELECT 1")
+
+
+def decode_keys(payload: str) -> list:
+    """Decodes the payload of a notification into a list of cache keys"""
+    try:
+        return [tuple(key) for key in json.loads(payload)]
+    except (TypeError, ValueError) as error:
+        logger.warning("Ignoring malformed cache invalidation %r: %s", payload, error)
+        return []
@@ -16,8 +16,16 @@
 """
 Flask CLI Command Extensions
 """
+import json
+from urllib.request import Request, urlopen
+import click
 from flask import current_app as app  # Import Flask application
-from service.models import db
+from service.models import db, migrate
+from service.models.migrations import schema_versions
+from service.common.assets import build_manifest
+from service.common.compression import precompress_static
+from service.common.profiling import merge_profiles, self_samples
+from service.common.slow_queries import HEADER as SLOW_QUERIES_HEADER
 
 
 ######################################################################
@@ -31,6 +39,119 @@ def db_create():
     Recreates a local database. You probably should not use this on
     production. ;-)
     """
-    db.drop_all()
-    db.create_all()
+    db.drop_all(bind_key=None)
+    with db.engine.begin() as connection:
+        schema_versions.drop(connection, checkfirst=True)
+        migrate(connection)
     db.session.commit()
+
+
+######################################################################
+# Command to migrate the schema to the version of the models
+# Usage:
+#   flask db-migrate [--to VERSION]
+######################################################################
+@app.cli.command("db-migrate")
+@click.option("--to", "target", type=int, default=None, help="Version to migrate to, the latest by default")
+def db_migrate(target):
+    """
+    Applies the schema migrations that the database has not had yet.
+    Run it once per release, before the new pods start
+    """
+    with db.engine.begin() as connection:
+        applied = migrate(connection, target)
+    for version, description in applied:
+        print(f"Migrated to version {version}: {description}")
+    if not applied:
+        print("The schema is up to date")
+
+
+######################################################################
+# Command to fingerprint the static files
+# Usage:
+#   flask build-assets
+######################################################################
+@app.cli.command("build-assets")
+def build_assets():
+    """
+    Copies the static files to names that hold a hash of their content,
+    which the index page refers to once the app restarts
+    """
+    manifest = build_manifest(app.static_folder)
+    print(f"Fingerprinted {len(manifest)} static files")
+
+
+######################################################################
+# Command to precompress the static files
+# Usage:
+#   flask compress-static
+######################################################################
+@app.cli.command("compress-static")
+def compress_static():
+    """
+    Writes gzip and brotli copies of the static files, which are sent
+    instead of compressing them on every request
+    """
+    written = precompress_static(
+        app.static_folder,
+        app.config["COMPRESSION_MIMETYPES"],
+        app.config["COMPRESSION_MIN_SIZE"],
+    )
+    print(f"Precompressed {len(written)} static files")
+
+
+######################################################################
+# Command to show the slow queries of a running worker
+# Usage:
+#   flask slow-queries [--url URL]
+######################################################################
+@app.cli.command("slow-queries")
+@click.option(
+    "--url", default="http://localhost:8080", show_default=True, help="Address of the running service"
+)
+def show_slow_queries(url):
+    """
+    Prints the latest slow statements, and their plans, that the worker
+    which answers has kept. Every worker keeps its own. The request carries
+    SLOW_QUERY_SECRET, which the service must share
+    """
+    request = Request(
+        f"{url.rstrip('/')}/admin/slow-queries", headers={SLOW_QUERIES_HEADER: app.config["SLOW_QUERY_SECRET"]}
+    )
+    with urlopen(request, timeout=10) as response:
+        entries = json.load(response)
+    for entry in entries:
+        print(f"{entry['time']}  {entry['duration_ms']:.1f} ms  {entry['route'] or 'no request'}")
+        print(f"    {entry['statement']}")
+        print(f"    parameters: {entry['parameters']}")
+        for line in (entry["plan"] or "").splitlines():
+            print(f"    | {line}")
+    if not entries:
+        print("No slow queries")
+
+
+######################################################################
+# Command to merge the request profiles into a flame graph input
+# Usage:
+#   flask profile-merge [--route RULE] [--method METHOD] [--output FILE]
+######################################################################
+@app.cli.command("profile-merge")
+@click.option("--route", default=None, help="Only the profiles of this URL rule, like /wishlists/<int:wishlist_id>")
+@click.option("--method", default=None, help="Only the profiles of this HTTP method")
+@click.option("--output", default="profile.folded", show_default=True, help="File to write the collapsed stacks to")
+@click.option("--top", default=10, show_default=True, help="Functions to list by their own samples")
+def profile_merge(route, method, output, top):
+    """
+    Adds up the profiled stacks of the requests in PROFILE_DIR into one
+    file of collapsed stacks, for flamegraph.pl, speedscope or inferno
+    """
+    profiles, stacks = merge_profiles(app.config["PROFILE_DIR"], route, method)
+    if not profiles:
+        print("No profiles found")
+        return
+    with open(output, "w", encoding="utf-8") as file:
+        file.writelines(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+    total = sum(stacks.values())
+    print(f"Merged {profiles} profiles, {total} samples, into {output}")
+    for function, count in self_samples(stacks).most_common(top):
+        print(f"{count / total:7.1%}  {function}")
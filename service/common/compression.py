@@ -0,0 +1,187 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Response Compression
+
+This module compresses responses with brotli, when the brotli extra is
+installed, or gzip, whichever the client prefers from its Accept-Encoding
+header. Streamed responses are
+compressed chunk by chunk, and static files are sent from copies that
+were compressed ahead of time.
+"""
+import gzip
+import logging
+import mimetypes
+import os
+import zlib
+from flask import current_app, request, send_from_directory
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+logger = logging.getLogger("flask.app")
+
+# the suffixes of the precompressed copies of static files
+SUFFIXES = {"br": ".br", "gzip": ".gz"}
+# wbits that make zlib write a gzip header and trailer
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+def init_compression(app):
+    """Compresses the responses of the app and its static files"""
+    app.after_request(compress_response)
+    app.view_functions["static"] = send_static_file
+
+
+def encodings() -> list:
+    """Returns the encodings the server supports, best first"""
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def compressible(response) -> bool:
+    """Returns whether a response is worth compressing"""
+    return (
+        200 <= response.status_code < 300
+        and response.status_code != 204
+        and not response.direct_passthrough
+        and "Content-Encoding" not in response.headers
+        and response.mimetype in current_app.config["COMPRESSION_MIMETYPES"]
+    )
+
+
+def compress_response(response):
+    """Compresses a response in the encoding that the client prefers"""
+    config = current_app.config
+    if not config["COMPRESSION_ENABLED"] or not compressible(response):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = request.accept_encodings.best_match(encodings())
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        # the length of a streamed body is not known up front
+        response.response = compress_stream(response.response, encoding)
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < config["COMPRESSION_MIN_SIZE"]:
+            return response
+        response.set_data(compress(data, encoding))
+
+    response.headers["Content-Encoding"] = encoding
+    # the compressed bytes differ, so a strong ETag no longer applies
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """Compresses a whole body"""
+    config = current_app.config
+    if encoding == "br":
+        return brotli.compress(data, quality=config["COMPRESSION_BROTLI_QUALITY"])
+    return gzip.compress(data, compresslevel=config["COMPRESSION_LEVEL"], mtime=0)
+
+
+def compress_stream(chunks, encoding: str):
+    """Compresses a streamed body, flushing every chunk to the client"""
+    config = current_app.config
+    try:
+        if encoding == "br":
+            compressor = brotli.Compressor(quality=config["COMPRESSION_BROTLI_QUALITY"])
+            for chunk in chunks:
+                yield compressor.process(as_bytes(chunk)) + compressor.flush()
+            yield compressor.finish()
+        else:
+            compressor = zlib.compressobj(config["COMPRESSION_LEVEL"], zlib.DEFLATED, GZIP_WBITS)
+            for chunk in chunks:
+                yield compressor.compress(as_bytes(chunk)) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            yield compressor.flush()
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+def as_bytes(chunk) -> bytes:
+    """Encodes the str chunks of a streamed body"""
+    return chunk.encode() if isinstance(chunk, str) else chunk
+
+
+######################################################################
+#  P R E C O M P R E S S E D   S T A T I C   F I L E S
+######################################################################
+def send_static_file(filename):
+    """Sends a static file, from a precompressed copy when the client takes one"""
+    app = current_app
+    available = [
+        encoding
+        for encoding in encodings()
+        if os.path.isfile(safe_join(app.static_folder, filename + SUFFIXES[encoding]) or "")
+    ]
+    encoding = request.accept_encodings.best_match(available) if available else None
+    if encoding is None:
+        response = app.send_static_file(filename)
+    else:
+        response = send_from_directory(
+            app.static_folder,
+            filename + SUFFIXES[encoding],
+            mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream",
+            max_age=app.get_send_file_max_age(filename),
+        )
+        response.headers["Content-Encoding"] = encoding
+    if available or response.mimetype in app.config["COMPRESSION_MIMETYPES"]:
+        response.vary.add("Accept-Encoding")
+    return response
+
+
+def precompress_static(folder, mimetypes_to_compress, min_size=0, level=9) -> list:
+    """Writes .gz copies, and .br copies with brotli, of the static files
+
+    Copies that are newer than their file are left alone
+
+    Returns:
+        list: the paths of the copies that were written
+    """
+    written = []
+    for root, _, filenames in os.walk(folder):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            if os.path.splitext(filename)[1] in (".gz", ".br"):
+                continue
+            if mimetypes.guess_type(filename)[0] not in mimetypes_to_compress:
+                continue
+            if os.path.getsize(path) < min_size:
+                continue
+            with open(path, "rb") as source:
+                data = source.read()
+            for encoding in encodings():
+                copy = path + SUFFIXES[encoding]
+                if os.path.exists(copy) and os.path.getmtime(copy) >= os.path.getmtime(path):
+                    continue
+                with open(copy, "wb") as target:
+                    if encoding == "br":
+                        target.write(brotli.compress(data, quality=11))
+                    else:
+                        target.write(gzip.compress(data, compresslevel=level, mtime=0))
+                written.append(copy)
+    logger.info("Precompressed %d static files in %s", len(written), folder)
+    return written
@@ -0,0 +1,81 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+JSON Providers
+
+This module picks the JSON encoder of the app: orjson when it is
+installed, by the json extra, since it encodes several times faster,
+and the standard library otherwise
+"""
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Encodes and decodes JSON with orjson
+
+    Values that orjson cannot encode, and dates, go through the default()
+    of Flask, so both providers encode the same documents the same way,
+    except that non-ASCII characters are written as UTF-8 rather than
+    escaped. The keyword arguments of json.dumps are ignored.
+    """
+
+    def options(self) -> int:
+        """Returns the orjson options that match the settings of the provider"""
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs) -> str:
+        """Serialize data as JSON to a string"""
+        return orjson.dumps(obj, default=self.default, option=self.options()).decode()
+
+    def loads(self, s, **kwargs):
+        """Deserialize data as JSON from a string or bytes"""
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        """Serialize the given arguments as JSON into a Response"""
+        obj = self._prepare_response_obj(args, kwargs)
+        option = self.options() | orjson.OPT_APPEND_NEWLINE
+        body = orjson.dumps(obj, default=self.default, option=option)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def init_json(app):
+    """Sets the JSON provider of the app from its JSON_PROVIDER setting
+
+    "auto" uses orjson when it is installed and the standard library
+    otherwise, "orjson" and "stdlib" ask for one of them
+    """
+    name = app.config["JSON_PROVIDER"]
+    if name not in ("auto", "orjson", "stdlib"):
+        raise ValueError(f"Unknown JSON_PROVIDER '{name}'")
+    if name == "orjson" and orjson is None:
+        app.logger.warning("JSON_PROVIDER is orjson but it is not installed")
+    if name != "stdlib" and orjson is not None:
+        app.json = OrjsonProvider(app)
+    else:
+        app.json = DefaultJSONProvider(app)
+    app.logger.info("Encoding JSON with %s", type(app.json).__name__)
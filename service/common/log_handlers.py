@@ -19,18 +19,157 @@ Log Handlers
 
 This module contains utility functions to set up logging
 consistently
+
+The records of the app are put on a bounded queue, and a QueueListener
+thread writes them to the gunicorn handlers, so a request never waits
+for stderr. When the queue is full the newest records are dropped, and
+how many were is logged as soon as there is room again. LOG_SAMPLE_RATES
+keeps only a fraction of the chatty levels, before their messages are
+even formatted. The listener thread formats the records too, so the
+request thread does not render their arguments, and their exceptions
+reach the formatter. With LOG_FORMAT=json every line is a JSON object,
+with the id of the request that logged it.
 """
+import atexit
+import copy
+import json
 import logging
+import queue
+import random
+import re
+import threading
+import uuid
+from logging.handlers import QueueHandler, QueueListener
+from flask import g, has_request_context, request
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+# the ids that a proxy or a client sends are kept when they look like ids
+VALID_REQUEST_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
 
 
 def init_logging(app, logger_name: str):
     """Set up logging for production"""
     app.logger.propagate = False
     gunicorn_logger = logging.getLogger(logger_name)
-    app.logger.handlers = gunicorn_logger.handlers
+    handlers = gunicorn_logger.handlers
     app.logger.setLevel(gunicorn_logger.level)
     # Make all log formats consistent
-    formatter = logging.Formatter("[%(asctime)s] [%(levelname)s] [%(module)s] %(message)s", "%Y-%m-%d %H:%M:%S %z")
-    for handler in app.logger.handlers:
+    if app.config["LOG_FORMAT"] == "json":
+        formatter = JsonFormatter(datefmt="%Y-%m-%d %H:%M:%S %z")
+    else:
+        formatter = logging.Formatter("[%(asctime)s] [%(levelname)s] [%(module)s] %(message)s", "%Y-%m-%d %H:%M:%S %z")
+    for handler in handlers:
         handler.setFormatter(formatter)
+    if app.config["LOG_ASYNC"]:
+        handler = DroppingQueueHandler(queue.Queue(app.config["LOG_QUEUE_SIZE"]))
+        listener = QueueListener(handler.queue, *handlers, respect_handler_level=True)
+        listener.start()
+        # the records still on the queue are written when the worker exits
+        atexit.register(listener.stop)
+        app.extensions["log_listener"] = listener
+        app.logger.handlers = [handler]
+    else:
+        app.logger.handlers = list(handlers)
+    for handler in app.logger.handlers:
+        handler.addFilter(SamplingFilter(app.config["LOG_SAMPLE_RATES"]))
+        handler.addFilter(RequestIdFilter())
+    app.before_request(assign_request_id)
+    app.after_request(send_request_id)
     app.logger.info("Logging handler established")
+
+
+######################################################################
+#  R E Q U E S T   I D S
+######################################################################
+def assign_request_id():
+    """Gives the request the id that came with it, or a new one"""
+    request_id = request.headers.get(REQUEST_ID_HEADER, "")
+    g.request_id = request_id if VALID_REQUEST_ID.match(request_id) else uuid.uuid4().hex
+
+
+def send_request_id(response):
+    """Sends the id of the request back with its response"""
+    if "request_id" in g:
+        response.headers[REQUEST_ID_HEADER] = g.request_id
+    return response
+
+
+class RequestIdFilter(logging.Filter):
+    """Adds the id of the current request to the records"""
+
+    def filter(self, record):
+        record.request_id = g.get("request_id") if has_request_context() else None
+        return True
+
+
+######################################################################
+#  S A M P L I N G   A N D   Q U E U I N G
+######################################################################
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of the records of some levels"""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = {logging.getLevelName(level.upper()): rate for level, rate in rates.items()}
+
+    def filter(self, record):
+        rate = self.rates.get(record.levelno, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Puts the records on a bounded queue without ever waiting for room"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._lock = threading.Lock()
+
+    def enqueue(self, record):
+        with self._lock:
+            try:
+                if self.dropped:
+                    self.queue.put_nowait(dropped_record(record, self.dropped))
+                    self.dropped = 0
+                self.queue.put_nowait(record)
+            except queue.Full:
+                self.dropped += 1
+
+    def prepare(self, record):
+        # QueueHandler would format the message here, on the request thread,
+        # and clear exc_info; the listener formats the record as it comes
+        return copy.copy(record)
+
+
+def dropped_record(record, count):
+    """Returns a warning that a number of records were dropped"""
+    return logging.makeLogRecord({
+        "name": record.name,
+        "levelno": logging.WARNING,
+        "levelname": "WARNING",
+        "module": __name__.rpartition(".")[2],
+        "msg": f"Dropped {count} log records while the log queue was full",
+        "request_id": None,
+    })
+
+
+######################################################################
+#  F O R M A T T I N G
+######################################################################
+class JsonFormatter(logging.Formatter):
+    """Formats every record as one JSON object"""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, self.datefmt),
+            "level": record.levelname,
+            "logger": record.name,
+            "module": record.module,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
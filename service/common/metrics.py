@@ -0,0 +1,336 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Request Metrics
+
+This module times every request and the phases inside it: the database
+time of its statements, which service.common.statement_timing hands it, and
+the ORM hydration, serialization and JSON encoding that the routes mark
+with timed(). The timings are sent back in a Server-Timing header and
+added up into per-route counters and latency histograms, which /metrics
+renders in the Prometheus text format. Other modules add samples of
+their own with add_source(), like the hits and misses of the payload
+cache.
+
+Every gunicorn worker counts its own requests. With METRICS_DIR set, the
+workers write their counts to files in that directory every
+METRICS_FLUSH_INTERVAL seconds, and a scrape adds up the files of all of
+them, so it sees the whole pod whichever worker answers it.
+"""
+import atexit
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from flask import g, has_request_context, request
+from service.common.statement_timing import watch
+
+# the order of the phases in the Server-Timing header
+PHASES = ("db", "orm", "serialize", "json")
+
+# name: (type, help) of every metric, in the order they are rendered
+METRICS = {
+    "http_requests_total": ("counter", "Requests answered, by route and status"),
+    "http_request_duration_seconds": ("histogram", "Time spent answering requests"),
+    "http_request_phase_seconds_total": ("counter", "Time spent in each phase of the requests"),
+    "db_queries_total": ("counter", "SQL statements executed by the requests"),
+    "cache_hits_total": ("counter", "Payload cache lookups answered from the cache"),
+    "cache_misses_total": ("counter", "Payload cache lookups that went to the database"),
+    "cache_evictions_total": ("counter", "Payloads dropped from the cache as least recently used or expired"),
+    "cache_entries": ("gauge", "Payloads held in the cache"),
+}
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Metrics:
+    """Counters and latency histograms of the requests of one worker"""
+
+    def __init__(self, buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)):
+        self.enabled = False
+        self.server_timing = False
+        self.buckets = tuple(buckets)
+        self.directory = ""
+        self.flush_interval = 5.0
+        self._counters = {}
+        self._histograms = {}
+        self._sources = []
+        self._lock = threading.Lock()
+        self._changed = False
+        self._pid = None
+        self._path = None
+        self._stop = threading.Event()
+
+    def init_app(self, app):
+        """Configures the metrics from the settings of a Flask app and times its requests"""
+        self.enabled = app.config["METRICS_ENABLED"]
+        self.server_timing = app.config["SERVER_TIMING_ENABLED"]
+        self.buckets = tuple(app.config["METRICS_BUCKETS"])
+        self.directory = app.config["METRICS_DIR"]
+        self.flush_interval = app.config["METRICS_FLUSH_INTERVAL"]
+        self.reset()
+        if not (self.enabled or self.server_timing):
+            return
+        watch(add_database_time)
+        app.before_request(start_timing)
+        app.after_request(self.finish_timing)
+        # jsonify() encodes through the provider, so that is where the encoding is timed
+        app.json.response = timed_function("json", app.json.response)
+
+    def reset(self):
+        """Forgets every count"""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._changed = False
+
+    ##################################################
+    # RECORDING
+    ##################################################
+
+    def finish_timing(self, response):
+        """Records the timings of the request and sends them in a Server-Timing header"""
+        timings = g.pop("timings", None)
+        if timings is None:
+            return response
+        total = time.perf_counter() - g.pop("started")
+        queries = g.pop("queries", 0)
+        if self.server_timing:
+            entries = [f"{phase};dur={timings[phase] * 1000:.2f}" for phase in PHASES if phase in timings]
+            entries.append(f"total;dur={total * 1000:.2f}")
+            response.headers.add("Server-Timing", ", ".join(entries))
+        if self.enabled:
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            labels = (("method", request.method), ("route", route))
+            self.record(labels, response.status_code, total, timings, queries)
+        return response
+
+    def record(self, labels, status_code, total, timings, queries):
+        """Adds a request to the counters and histograms"""
+        if self.directory:
+            self.start_flushing()
+        with self._lock:
+            self._inc("http_requests_total", labels + (("status", str(status_code)),))
+            self._inc("db_queries_total", labels, queries)
+            for phase, seconds in timings.items():
+                self._inc("http_request_phase_seconds_total", labels + (("phase", phase),), seconds)
+            histogram = self._histograms.setdefault(
+                ("http_request_duration_seconds", labels), [0] * len(self.buckets) + [0.0, 0]
+            )
+            for index, bound in enumerate(self.buckets):
+                if total <= bound:
+                    histogram[index] += 1
+            histogram[-2] += total
+            histogram[-1] += 1
+            self._changed = True
+
+    def add_source(self, source):
+        """Adds the samples of a function, which returns (metric, labels, value) triples, to every snapshot
+
+        The samples of every worker are added up like the counters, so a
+        source reports the totals of its own process
+        """
+        if source not in self._sources:
+            self._sources.append(source)
+
+    def _inc(self, name, labels, amount=1):
+        key = (name, labels)
+        self._counters[key] = self._counters.get(key, 0) + amount
+
+    ##################################################
+    # SHARED DIRECTORY
+    ##################################################
+
+    def start_flushing(self):
+        """Starts writing the counts of this worker to the directory, once per process"""
+        if self._pid == os.getpid():
+            return
+        if self._pid is not None:
+            # a forked worker writes its own counts, which its parent's file already holds
+            self.reset()
+        self._pid = os.getpid()
+        self._path = os.path.join(self.directory, f"metrics-{self._pid}-{uuid.uuid4().hex[:8]}.json")
+        self._stop = threading.Event()
+        thread = threading.Thread(target=self._flush_periodically, args=(self._stop,), daemon=True)
+        thread.start()
+        atexit.register(self.flush)
+
+    def stop_flushing(self):
+        """Stops writing the counts of this worker, after writing them one last time"""
+        self._stop.set()
+        self.flush()
+        self._pid = None
+
+    def _flush_periodically(self, stop):
+        while not stop.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """Writes the counts of this worker to its file when they changed"""
+        if self._path is None:
+            return
+        with self._lock:
+            if not self._changed:
+                return
+            snapshot = self.snapshot()
+            self._changed = False
+        # a scrape never reads a half written file
+        handle, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(handle, "w") as file:
+            json.dump(snapshot, file)
+        os.replace(temporary, self._path)
+
+    def snapshot(self) -> dict:
+        """Returns the counts of this worker in a form that can be written as JSON"""
+        counters = [[name, labels, value] for (name, labels), value in self._counters.items()]
+        for source in self._sources:
+            counters.extend([name, labels, value] for name, labels, value in source())
+        return {
+            "counters": counters,
+            "histograms": [[name, labels, values] for (name, labels), values in self._histograms.items()],
+        }
+
+    def collect(self) -> dict:
+        """Returns the counts of this worker, or of every worker with a directory"""
+        if not self.directory:
+            with self._lock:
+                return self.snapshot()
+        self.flush()
+        snapshots = []
+        for path in glob.glob(os.path.join(self.directory, "metrics-*.json")):
+            try:
+                with open(path, encoding="utf-8") as file:
+                    snapshots.append(json.load(file))
+            except (OSError, ValueError):
+                continue
+        return merge(snapshots)
+
+    def render(self) -> str:
+        """Returns the counts in the Prometheus text exposition format"""
+        snapshot = self.collect()
+        lines = []
+        for name, (kind, description) in METRICS.items():
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind != "histogram":
+                for metric, labels, value in sorted(snapshot["counters"]):
+                    if metric == name:
+                        lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+            else:
+                for metric, labels, values in sorted(snapshot["histograms"]):
+                    if metric == name:
+                        lines.extend(render_histogram(name, labels, values, self.buckets))
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+######################################################################
+#  R E Q U E S T   T I M I N G
+######################################################################
+def start_timing():
+    """Starts timing a request"""
+    g.started = time.perf_counter()
+    g.timings = {}
+    g.queries = 0
+
+
+def add_database_time(conn, cursor, statement, parameters, executemany, elapsed):  # pylint: disable=R0913,R0917,W0613
+    """Adds the time a statement took to the database time of the request"""
+    if has_request_context() and "timings" in g:
+        g.timings["db"] = g.timings.get("db", 0.0) + elapsed
+        g.queries += 1
+
+
+@contextmanager
+def timed(phase):
+    """Adds the time spent in a block to a phase of the request, less its database time"""
+    if not has_request_context() or "timings" not in g:
+        yield
+        return
+    started = time.perf_counter()
+    database = g.timings.get("db", 0.0)
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started - (g.timings.get("db", 0.0) - database)
+        g.timings[phase] = g.timings.get(phase, 0.0) + elapsed
+
+
+def timed_function(phase, function):
+    """Returns a function that adds the time spent in another one to a phase"""
+
+    def wrapper(*args, **kwargs):
+        with timed(phase):
+            return function(*args, **kwargs)
+
+    return wrapper
+
+
+######################################################################
+#  E X P O S I T I O N
+######################################################################
+def merge(snapshots) -> dict:
+    """Adds up the counts of several workers"""
+    counters, histograms = {}, {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot["counters"]:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, values in snapshot["histograms"]:
+            key = (name, tuple(map(tuple, labels)))
+            if key in histograms:
+                histograms[key] = [total + value for total, value in zip(histograms[key], values)]
+            else:
+                histograms[key] = list(values)
+    return {
+        "counters": [[name, labels, value] for (name, labels), value in counters.items()],
+        "histograms": [[name, labels, values] for (name, labels), values in histograms.items()],
+    }
+
+
+def render_histogram(name, labels, values, buckets) -> list:
+    """Returns the bucket, sum and count lines of a histogram"""
+    lines = [
+        f"{name}_bucket{format_labels(list(labels) + [('le', repr(float(bound)))])} {count}"
+        for bound, count in zip(buckets, values)
+    ]
+    lines.append(f"{name}_bucket{format_labels(list(labels) + [('le', '+Inf')])} {values[-1]}")
+    lines.append(f"{name}_sum{format_labels(labels)} {format_value(values[-2])}")
+    lines.append(f"{name}_count{format_labels(labels)} {values[-1]}")
+    return lines
+
+
+def format_labels(labels) -> str:
+    """Formats (name, value) pairs as Prometheus labels"""
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels:
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{key}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def format_value(value) -> str:
+    """Formats a sample value, as an integer when it is one"""
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
@@ -0,0 +1,94 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Connection Pool Statistics
+
+This module contains a QueuePool that counts the checkouts that had to
+wait for a connection, so the pool of each worker can be sized against
+the max_connections of the database
+"""
+import os
+import threading
+import time
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+
+class MonitoredQueuePool(QueuePool):
+    """QueuePool that counts waits for a free connection and their timeouts"""
+
+    def __init__(self, creator, **kwargs):
+        super().__init__(creator, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.waits = 0
+        self.wait_time = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        # a checkout blocks only when no connection is idle and no more can be opened
+        if self.checkedin() or self._max_overflow < 0 or self.overflow() < self._max_overflow:
+            return super()._do_get()
+        started = time.perf_counter()
+        timed_out = False
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            timed_out = True
+            raise
+        finally:
+            with self._stats_lock:
+                self.waits += 1
+                self.wait_time += time.perf_counter() - started
+                self.timeouts += timed_out
+
+    def stats(self) -> dict:
+        """Returns the connections of the pool and how often checkouts waited"""
+        with self._stats_lock:
+            return {
+                "size": self.size(),
+                "max_overflow": self._max_overflow,
+                "checked_in": self.checkedin(),
+                "checked_out": self.checkedout(),
+                "overflow": max(self.overflow(), 0),
+                "waits": self.waits,
+                "wait_ms": round(self.wait_time * 1000, 3),
+                "timeouts": self.timeouts,
+            }
+
+
+def init_pool(app):
+    """Checks the connection mode and monitors the pool when it is a QueuePool"""
+    mode = app.config["DB_CONNECTION_MODE"]
+    if mode not in ("direct", "pgbouncer"):
+        raise ValueError(f"Unknown DB_CONNECTION_MODE '{mode}'")
+    if mode == "pgbouncer" and app.config["DB_STATEMENT_TIMEOUT"]:
+        app.logger.warning(
+            "DB_STATEMENT_TIMEOUT is not sent through PgBouncer, set statement_timeout on the database role"
+        )
+    binds = app.config.get("SQLALCHEMY_BINDS", {}).values()
+    for options in [app.config["SQLALCHEMY_ENGINE_OPTIONS"], *binds]:
+        if isinstance(options, dict) and "pool_size" in options:
+            options.setdefault("poolclass", MonitoredQueuePool)
+
+
+def pool_stats(engine) -> dict:
+    """Returns the statistics of the connection pool of this worker"""
+    pool = engine.pool
+    stats = {"pid": os.getpid(), "pool": type(pool).__name__}
+    if isinstance(pool, MonitoredQueuePool):
+        stats.update(pool.stats())
+    return stats
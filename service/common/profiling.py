@@ -0,0 +1,188 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Request Profiler
+
+This module samples the stack of 1 in every PROFILE_SAMPLE_RATE requests,
+and of the requests that send PROFILE_SECRET in an X-Profile header. A
+thread of its own looks at the stack of the request thread every
+PROFILE_INTERVAL_MS milliseconds while the request runs, which costs the
+request next to nothing, unlike tracing every call with cProfile.
+
+Each profile is written to PROFILE_DIR as collapsed stacks, one line of
+"frame;frame;frame count" per stack, and the oldest files are deleted
+beyond PROFILE_MAX_FILES. `flask profile-merge` adds them up into one
+file for flamegraph.pl, speedscope or inferno.
+"""
+import glob
+import hmac
+import itertools
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from flask import g, request
+
+HEADER = "X-Profile"
+SUFFIX = ".folded"
+
+
+class Profiler:
+    """Samples the stacks of some of the requests of a Flask app"""
+
+    def __init__(self):
+        self.rate = 0
+        self.secret = ""
+        self.directory = ""
+        self.interval = 0.001
+        self.max_files = 100
+        self._requests = itertools.count(1)
+
+    def init_app(self, app):
+        """Configures the profiler from the settings of a Flask app and profiles its requests"""
+        self.rate = app.config["PROFILE_SAMPLE_RATE"]
+        self.secret = app.config["PROFILE_SECRET"]
+        self.directory = app.config["PROFILE_DIR"]
+        self.interval = app.config["PROFILE_INTERVAL_MS"] / 1000
+        self.max_files = app.config["PROFILE_MAX_FILES"]
+        if not (self.rate > 0 or self.secret):
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        app.before_request(self.start_profile)
+        app.teardown_request(self.finish_profile)
+
+    def wanted(self) -> bool:
+        """Returns whether the current request is to be profiled"""
+        header = request.headers.get(HEADER)
+        if self.secret and header and hmac.compare_digest(header, self.secret):
+            return True
+        return self.rate > 0 and next(self._requests) % self.rate == 0
+
+    def start_profile(self):
+        """Starts sampling the stack of the request thread"""
+        if not self.wanted():
+            return
+        stacks = Counter()
+        stop = threading.Event()
+        thread = threading.Thread(
+            target=sample, args=(threading.get_ident(), stop, self.interval, stacks), daemon=True
+        )
+        g.profile = (stop, thread, stacks)
+        thread.start()
+
+    def finish_profile(self, exception=None):  # pylint: disable=unused-argument
+        """Stops sampling and writes the stacks of the request"""
+        profile = g.pop("profile", None)
+        if profile is None:
+            return
+        stop, thread, stacks = profile
+        stop.set()
+        thread.join()
+        if stacks:
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            self.write(f"{request.method}-{slug(route)}", stacks)
+
+    def write(self, name, stacks) -> str:
+        """Writes collapsed stacks to a new file and deletes the oldest ones beyond the limit"""
+        path = os.path.join(self.directory, f"{time.time_ns()}-{os.getpid()}-{name}{SUFFIX}")
+        with open(path, "w", encoding="utf-8") as file:
+            file.writelines(f"{stack} {count}\n" for stack, count in stacks.items())
+        # the names start with the time, so they sort from the oldest
+        for old in sorted(glob.glob(os.path.join(self.directory, f"*{SUFFIX}")))[:-self.max_files]:
+            try:
+                os.remove(old)
+            except FileNotFoundError:
+                # another worker deleted it first
+                continue
+        return path
+
+
+profiler = Profiler()
+
+
+######################################################################
+#  S A M P L I N G
+######################################################################
+def sample(thread_id, stop, interval, stacks):
+    """Counts the stacks of a thread until it is told to stop"""
+    while not stop.wait(interval):
+        frame = sys._current_frames().get(thread_id)  # pylint: disable=protected-access
+        if frame is None or stop.is_set():
+            # the request finished while this thread was waking up
+            return
+        stacks[collapse(frame)] += 1
+
+
+def collapse(frame) -> str:
+    """Returns a stack as its frames from the outermost, separated by semicolons"""
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f"{frame.f_globals.get('__name__', '?')}.{code.co_qualname}")
+        frame = frame.f_back
+    return ";".join(reversed(frames))
+
+
+def slug(route) -> str:
+    """Returns a URL rule in a form that can be part of a file name"""
+    return re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+
+
+######################################################################
+#  M E R G I N G
+######################################################################
+def merge_profiles(directory, route=None, method=None) -> tuple:
+    """Adds up the stacks of the profiles in a directory
+
+    Args:
+        directory (str): the directory the profiles were written to
+        route (str): only the profiles of this URL rule, or all of them
+        method (str): only the profiles of this HTTP method, or all of them
+
+    Returns:
+        tuple: the number of profiles and a Counter of their stacks
+    """
+    stacks = Counter()
+    profiles = 0
+    for path in glob.glob(os.path.join(directory, f"*{SUFFIX}")):
+        # <time>-<pid>-<method>-<route>.folded
+        fields = os.path.basename(path)[: -len(SUFFIX)].split("-", 3)
+        if len(fields) != 4:
+            # a merged file that was written next to the profiles
+            continue
+        name_method, name_route = fields[2], fields[3]
+        if (route and name_route != slug(route)) or (method and name_method != method.upper()):
+            continue
+        try:
+            with open(path, encoding="utf-8") as file:
+                for line in file:
+                    stack, _, count = line.rstrip("\n").rpartition(" ")
+                    stacks[stack] += int(count)
+        except FileNotFoundError:
+            continue
+        profiles += 1
+    return profiles, stacks
+
+
+def self_samples(stacks) -> Counter:
+    """Returns how many samples each function was running in itself, not in what it called"""
+    functions = Counter()
+    for stack, count in stacks.items():
+        functions[stack.rpartition(";")[2]] += count
+    return functions
@@ -0,0 +1,180 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Query String Arguments
+
+This module parses the query string arguments of the list views for both
+the WSGI routes and the ASGI service. The request passed in only needs
+an args MultiDict and a base_url, which the Flask request and the ASGI
+request both have. A malformed argument raises BadRequest, which both
+services answer with their JSON 400 error.
+"""
+from datetime import date
+from urllib.parse import urlencode
+from werkzeug.exceptions import BadRequest
+from service.common.cursors import encode_cursor, decode_cursor
+from service.models import Wishlist
+
+# the range of an INTEGER column, which the database rejects values beyond
+INTEGER_MIN, INTEGER_MAX = -(2**31), 2**31 - 1
+
+
+def filter_wishlists(request, query):
+    """Narrows a Wishlist query down with the filters in the query string
+
+    ?user_id=, ?title= (exact), ?title_prefix= (case-insensitive) and the
+    inclusive ?date_from= and ?date_to= days can be combined
+    """
+    title = request.args.get("title")
+    if title:
+        query = Wishlist.find_by_title(title, query)
+    title_prefix = request.args.get("title_prefix")
+    if title_prefix:
+        query = Wishlist.find_by_title_prefix(title_prefix, query)
+    user_id = request.args.get("user_id")
+    if user_id is not None:
+        try:
+            user_id = to_integer(user_id)
+        except ValueError as error:
+            raise BadRequest("user_id must be an integer") from error
+        query = Wishlist.find_by_user_id(user_id, query)
+    start, end = get_date_arg(request, "date_from"), get_date_arg(request, "date_to")
+    if start or end:
+        query = Wishlist.find_by_date_range(start, end, query)
+    return query
+
+
+def to_integer(value) -> int:
+    """Returns a query string value as an int within the INTEGER range
+
+    Raises:
+        ValueError: when the value is not an integer, or is beyond the range
+    """
+    number = int(value)
+    if not INTEGER_MIN <= number <= INTEGER_MAX:
+        raise ValueError(f"{value} is beyond the INTEGER range")
+    return number
+
+
+def get_projection_args(request, model, default_include=()):
+    """Returns the (fields, include) sparse fieldset arguments of the request
+
+    ?fields=id,title picks the columns to return and ?include=items embeds
+    the related records. Without ?include= only those in default_include
+    are embedded, which list views leave empty
+    """
+    fields = request.args.get("fields")
+    if fields is not None:
+        fields = [field.strip() for field in fields.split(",") if field.strip()]
+        if not fields:
+            raise BadRequest(f"fields must name at least one of {', '.join(model.FIELDS)}")
+        unknown = [field for field in fields if field not in model.FIELDS]
+        if unknown:
+            raise BadRequest(f"Unknown fields: {', '.join(unknown)}; choose from {', '.join(model.FIELDS)}")
+    include = request.args.get("include")
+    if include is None:
+        return fields, list(default_include)
+    include = [name.strip() for name in include.split(",") if name.strip()]
+    unknown = [name for name in include if name not in model.INCLUDES]
+    if unknown:
+        raise BadRequest(f"Unknown include: {', '.join(unknown)}; choose from {', '.join(model.INCLUDES)}")
+    return fields, include
+
+
+def get_date_arg(request, name):
+    """Returns a YYYY-MM-DD query parameter as a date, or None if it is absent"""
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError as error:
+        raise BadRequest(f"{name} must be a YYYY-MM-DD date") from error
+
+
+def get_page_args(request, max_limit, default_limit=None):
+    """Returns the (limit, after) keyset pagination arguments of the request
+
+    Args:
+        request: the request whose query string holds ?limit= and ?cursor=
+        max_limit (int): the largest page size, which bigger limits are cut to
+        default_limit (int): the page size without ?limit=, None for every record
+    """
+    limit = get_limit_arg(request, max_limit)
+    if limit is None and default_limit is not None:
+        limit = min(default_limit, max_limit)
+    return limit, get_cursor_arg(request)
+
+
+def get_position_args(request, max_limit, default_limit):
+    """Returns the (limit, position) arguments of a ranked listing
+
+    Ranked results are paged by position rather than by id, so the cursor
+    holds how many results came before the page
+
+    Args:
+        request: the request whose query string holds ?limit= and ?cursor=
+        max_limit (int): the largest page size, which bigger limits are cut to
+        default_limit (int): the page size without ?limit=
+    """
+    limit = get_limit_arg(request, max_limit) or default_limit
+    return limit, get_cursor_arg(request) or 0
+
+
+def get_cursor_arg(request):
+    """Returns the id or position that ?cursor= holds, or None if it is absent
+
+    Both stay within the INTEGER range, which the database rejects beyond
+    """
+    cursor = request.args.get("cursor")
+    if cursor is None:
+        return None
+    try:
+        value = decode_cursor(cursor)
+    except ValueError as error:
+        raise BadRequest(f"Invalid cursor: '{cursor}'") from error
+    if not 0 <= value <= INTEGER_MAX:
+        raise BadRequest(f"Invalid cursor: '{cursor}'")
+    return value
+
+
+def get_limit_arg(request, max_limit):
+    """Returns the ?limit= page size cut to max_limit, or None if it is absent"""
+    limit = request.args.get("limit")
+    if limit is None:
+        return None
+    try:
+        limit = int(limit)
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        raise BadRequest("limit must be a positive integer")
+    return min(limit, max_limit)
+
+
+def next_page_link(request, results, limit, position=None):
+    """Returns a Link header pointing at the next page when the page is full
+
+    The cursor holds the id of the last record, or a position when given
+    """
+    if limit is None or len(results) < limit:
+        return {}
+    args = request.args.copy()
+    args["cursor"] = encode_cursor(results[-1]["id"] if position is None else position)
+    # the query string is kept as it is, even where it repeats a path argument
+    next_url = f"{request.base_url}?{urlencode(list(args.items(multi=True)))}"
+    return {"Link": f'<{next_url}>; rel="next"'}
@@ -0,0 +1,195 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Slow Query Log
+
+This module watches the statements that the engines of the app execute
+and logs every one that takes longer than SLOW_QUERY_THRESHOLD_MS, with
+the route that sent it and its parameters redacted. The latest of them
+are kept in a bounded ring buffer that GET /admin/slow-queries returns.
+
+With SLOW_QUERY_EXPLAIN set, the plan of a slow SELECT is captured too,
+on PostgreSQL inside a savepoint of the same transaction. EXPLAIN
+(ANALYZE, BUFFERS) runs the statement again, so it is only used for a
+SELECT that calls no function but those known to be read only, since
+one like pg_notify() or nextval() would act twice; any other SELECT gets
+a plain EXPLAIN. A statement is explained at most once every
+SLOW_QUERY_EXPLAIN_INTERVAL seconds, and the plan can hold the values
+that the parameters had.
+
+The buffer can hold those values and the routes of the app, so the
+endpoint answers only requests that carry SLOW_QUERY_SECRET in their
+X-Slow-Queries header, the way the profiler does.
+"""
+import hmac
+import logging
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from flask import has_request_context, request
+from service.common.statement_timing import watch
+
+logger = logging.getLogger("flask.app")
+
+HEADER = "X-Slow-Queries"
+SAVEPOINT = "slow_query_explain"
+
+# a name followed by an opening parenthesis: a function call or an SQL keyword
+CALL = re.compile(r"\b([a-z_][a-z0-9_]*)\s*\(", re.IGNORECASE)
+
+# what a SELECT may call and still be run again by EXPLAIN ANALYZE
+READ_ONLY_CALLS = frozenset((
+    # keywords that come before a parenthesis
+    "select", "from", "join", "on", "where", "and", "or", "not", "in", "exists", "any", "all",
+    "as", "values", "using", "over", "filter", "lateral", "cast", "coalesce", "nullif",
+    # the functions of the queries of this service
+    "count", "sum", "min", "max", "avg", "lower", "upper", "length",
+    "to_tsvector", "to_tsquery", "plainto_tsquery", "websearch_to_tsquery", "ts_rank", "ts_rank_cd",
+))
+
+
+class SlowQueryLog:
+    """Logs the statements slower than a threshold and keeps the latest ones"""
+
+    def __init__(self, threshold_ms=0.0, size=50):
+        self.threshold = threshold_ms / 1000
+        self.explain = False
+        self.explain_interval = 60.0
+        self.secret = ""
+        self._entries = deque(maxlen=size)
+        self._explained = {}
+        self._engines = set()
+        self._lock = threading.Lock()
+
+    def init_app(self, app, engines):
+        """Configures the log from the settings of a Flask app and watches its engines
+
+        Args:
+            app (Flask): the app whose settings are used
+            engines (list): the engines whose statements are watched
+        """
+        self.threshold = app.config["SLOW_QUERY_THRESHOLD_MS"] / 1000
+        self.explain = app.config["SLOW_QUERY_EXPLAIN"]
+        self.explain_interval = app.config["SLOW_QUERY_EXPLAIN_INTERVAL"]
+        self.secret = app.config["SLOW_QUERY_SECRET"]
+        self._entries = deque(maxlen=app.config["SLOW_QUERY_BUFFER_SIZE"])
+        self._explained.clear()
+        self._engines = set(engines)
+        if self.threshold <= 0:
+            return
+        watch(self.log_statement)
+
+    def log_statement(self, conn, cursor, statement, parameters, executemany, elapsed):  # pylint: disable=R0913,R0917
+        """Logs a statement of the watched engines that took longer than the threshold"""
+        if self.threshold <= 0 or elapsed < self.threshold or statement.startswith("EXPLAIN"):
+            return
+        if conn.engine not in self._engines:
+            return
+        route = None
+        if has_request_context():
+            # the rule rather than the path keeps the ids of the records out of the log
+            route = f"{request.method} {request.url_rule.rule if request.url_rule else request.path}"
+        redacted = redact(parameters, executemany)
+        logger.warning("Slow query (%.1f ms) from %s: %s %s", elapsed * 1000, route or "no request", statement, redacted)
+        entry = {
+            "time": datetime.now(timezone.utc).isoformat(),
+            "duration_ms": round(elapsed * 1000, 3),
+            "route": route,
+            "statement": statement,
+            "parameters": redacted,
+            "plan": None,
+        }
+        if self.explain and not executemany and self.should_explain(statement):
+            entry["plan"] = explain(conn, cursor, statement, parameters, analyze=read_only(statement))
+        with self._lock:
+            self._entries.append(entry)
+
+    def should_explain(self, statement) -> bool:
+        """Returns whether a SELECT was not explained within the interval"""
+        if not statement.lstrip().upper().startswith("SELECT"):
+            # even a plain EXPLAIN of a write would take its locks
+            return False
+        now = time.monotonic()
+        with self._lock:
+            if self._explained.get(statement, 0) > now:
+                return False
+            self._explained[statement] = now + self.explain_interval
+        return True
+
+    def authorized(self, header) -> bool:
+        """Returns whether a request header holds the secret that lets it read the buffer"""
+        return bool(self.secret and header and hmac.compare_digest(header, self.secret))
+
+    def entries(self) -> list:
+        """Returns the slow statements in the buffer, the latest first"""
+        with self._lock:
+            return list(reversed(self._entries))
+
+    def clear(self):
+        """Empties the buffer"""
+        with self._lock:
+            self._entries.clear()
+            self._explained.clear()
+
+
+slow_queries = SlowQueryLog()
+
+
+def read_only(statement) -> bool:
+    """Returns whether a SELECT calls no function that could act when it is run again"""
+    return all(name.lower() in READ_ONLY_CALLS for name in CALL.findall(statement))
+
+
+def redact(parameters, executemany=False):
+    """Returns the names or positions of the parameters without their values"""
+    if executemany:
+        return f"<{len(parameters)} rows>"
+    if isinstance(parameters, dict):
+        return {name: "?" for name in parameters}
+    return ["?"] * len(parameters or ())
+
+
+def explain(conn, cursor, statement, parameters, analyze=False):
+    """Returns the plan of a statement in the same transaction, run by the database if analyze"""
+    dialect = conn.dialect.name
+    if dialect == "postgresql":
+        prefix = "EXPLAIN (ANALYZE, BUFFERS) " if analyze else "EXPLAIN "
+    elif dialect == "sqlite":
+        prefix = "EXPLAIN QUERY PLAN "
+    else:
+        return None
+    # a cursor of its own keeps the rows of the statement for the app
+    explainer = cursor.connection.cursor()
+    savepoint = dialect == "postgresql" and not getattr(cursor.connection, "autocommit", False)
+    try:
+        if savepoint:
+            # a failed EXPLAIN must not abort the transaction of the app
+            explainer.execute(f"SAVEPOINT {SAVEPOINT}")
+        explainer.execute(prefix + statement, parameters)
+        rows = explainer.fetchall()
+        if savepoint:
+            explainer.execute(f"RELEASE SAVEPOINT {SAVEPOINT}")
+    except Exception as error:  # pylint: disable=broad-except
+        logger.warning("Cannot explain slow query: %s", error)
+        if savepoint:
+            explainer.execute(f"ROLLBACK TO SAVEPOINT {SAVEPOINT}")
+        return None
+    finally:
+        explainer.close()
+    return "\n".join(" ".join(str(value) for value in row) for row in rows)
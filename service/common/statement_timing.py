@@ -0,0 +1,66 @@
+######################################################################
+# Copyright 2016, 2024 John J. Rofrano. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+# https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+######################################################################
+
+"""
+Statement Timing
+
+This module times every statement that the engines execute, once, for
+the request metrics and the slow query log alike. The cursor events of
+SQLAlchemy push the start of a statement on a stack of its connection,
+and pop it when the statement returns or fails. The time it took is
+handed to every watcher.
+"""
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+STARTED = "statement_started"
+
+watchers = []
+
+
+def watch(watcher):
+    """Hands the time that every statement takes to a function from now on
+
+    Args:
+        watcher (callable): called with (conn, cursor, statement, parameters,
+            executemany, elapsed) after every statement, elapsed in seconds
+    """
+    if not event.contains(Engine, "before_cursor_execute", before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", after_cursor_execute)
+        event.listen(Engine, "handle_error", handle_error)
+    if watcher not in watchers:
+        watchers.append(watcher)
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):  # pylint: disable=R0913,R0917,W0613
+    """Notes when a statement was sent to the database"""
+    conn.info.setdefault(STARTED, []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):  # pylint: disable=R0913,R0917,W0613
+    """Hands the time a statement took to the watchers"""
+    elapsed = time.perf_counter() - conn.info[STARTED].pop()
+    for watcher in watchers:
+        watcher(conn, cursor, statement, parameters, executemany, elapsed)
+
+
+def handle_error(exception_context):
+    """Forgets the start of a statement that failed, which no after event follows"""
+    conn = exception_context.connection
+    if conn is not None and conn.info.get(STARTED):
+        conn.info[STARTED].pop()
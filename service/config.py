@@ -13,8 +13,162 @@ DATABASE_URI = os.getenv(
 # Configure SQLAlchemy
 SQLALCHEMY_DATABASE_URI = DATABASE_URI
 SQLALCHEMY_TRACK_MODIFICATIONS = False
-# SQLALCHEMY_POOL_SIZE = 2
+
+# Connection pool of every worker: keep workers * (size + overflow) under
+# the max_connections of the database. A checkout waits at most
+# DB_POOL_TIMEOUT seconds, connections are replaced after DB_POOL_RECYCLE
+# seconds (-1 never) and tested before use when DB_POOL_PRE_PING is true
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# Milliseconds PostgreSQL lets a statement run before cancelling it, 0 for no limit
+DB_STATEMENT_TIMEOUT = int(os.getenv("DB_STATEMENT_TIMEOUT", "0"))
+# "direct" lets psycopg prepare the statements that a connection runs
+# DB_PREPARE_THRESHOLD times. "pgbouncer" turns that off, as a transaction
+# pooler hands every transaction to any server connection, and leaves the
+# statement timeout to the database role, as startup options do not pass
+DB_CONNECTION_MODE = os.getenv("DB_CONNECTION_MODE", "direct")
+DB_PREPARE_THRESHOLD = int(os.getenv("DB_PREPARE_THRESHOLD", "5"))
+
+
+def engine_options(uri: str) -> dict:
+    """Returns the create_engine() options of the database at uri"""
+    options = {"pool_pre_ping": DB_POOL_PRE_PING, "pool_recycle": DB_POOL_RECYCLE}
+    if not uri.startswith("postgresql"):
+        # SQLite uses a pool that takes no size
+        return options
+    options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+    options["connect_args"] = {}
+    if DB_STATEMENT_TIMEOUT and DB_CONNECTION_MODE != "pgbouncer":
+        options["connect_args"]["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT}"
+    if uri.startswith("postgresql+psycopg:"):
+        options["connect_args"]["prepare_threshold"] = (
+            None if DB_CONNECTION_MODE == "pgbouncer" else DB_PREPARE_THRESHOLD
+        )
+    return options
+
+
+SQLALCHEMY_ENGINE_OPTIONS = engine_options(DATABASE_URI)
+
+# Read replicas of the GET routes, as a comma separated list of URIs. A
+# client that wrote is sent to the primary for READ_YOUR_WRITES_WINDOW
+# seconds and a replica that fails is skipped for REPLICA_RETRY_INTERVAL
+DATABASE_REPLICA_URIS = [uri for uri in os.getenv("DATABASE_REPLICA_URIS", "").split(",") if uri]
+SQLALCHEMY_BINDS = {
+    f"replica_{n}": {"url": uri, **engine_options(uri)} for n, uri in enumerate(DATABASE_REPLICA_URIS)
+}
+READ_YOUR_WRITES_WINDOW = int(os.getenv("READ_YOUR_WRITES_WINDOW", "5"))
+REPLICA_RETRY_INTERVAL = float(os.getenv("REPLICA_RETRY_INTERVAL", "30"))
+
+# Whether app startup migrates a schema that is behind the models, rather
+# than refusing to start until `flask db-migrate` has been run
+DB_MIGRATE_ON_START = os.getenv("DB_MIGRATE_ON_START", "true").lower() == "true"
+
+# Largest page size accepted by the ?limit= query parameter
+PAGINATION_MAX_LIMIT = int(os.getenv("PAGINATION_MAX_LIMIT", "1000"))
+
+# Page size of the JSON listings when no ?limit= is given (streamed ones
+# send every record)
+PAGINATION_DEFAULT_LIMIT = int(os.getenv("PAGINATION_DEFAULT_LIMIT", "100"))
+
+# Page size of GET /wishlists/search when no ?limit= is given
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "20"))
+
+# Largest array accepted by the :batch create endpoints and ?ids= lookups
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "1000"))
+
+# Threads of every worker that run the duplicates accepted with ?async=true
+BACKGROUND_WORKERS = int(os.getenv("BACKGROUND_WORKERS", "2"))
+
+# Rows fetched per round-trip and written per chunk by streaming listings
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "500"))
+
+# In-process read-through cache of serialized wishlists and items
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "false").lower() == "true"
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+CACHE_TTL = float(os.getenv("CACHE_TTL", "60"))
+# PostgreSQL NOTIFY channel that shares invalidations between workers. The
+# workers LISTEN on a connection of their own to CACHE_CHANNEL_URI, or to
+# DATABASE_URI when it is not set. A transaction pooler drops LISTEN, so
+# with DB_CONNECTION_MODE=pgbouncer it must name the database itself
+CACHE_INVALIDATION_CHANNEL = os.getenv("CACHE_INVALIDATION_CHANNEL", "")
+CACHE_CHANNEL_URI = os.getenv("CACHE_CHANNEL_URI", "")
+
+# Compression of responses, negotiated from Accept-Encoding
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() == "true"
+# Smaller bodies are sent as they are; streamed bodies are always compressed
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "500"))
+# gzip level from 1 (fastest) to 9 (smallest) and brotli quality from 0 to 11
+COMPRESSION_LEVEL = int(os.getenv("COMPRESSION_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+COMPRESSION_MIMETYPES = [
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "text/javascript",
+    "text/css",
+    "text/html",
+    "text/plain",
+    "image/svg+xml",
+]
+
+# Request timing: the phases of every request go out in a Server-Timing
+# header and into the counters and latency histograms of GET /metrics
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "true").lower() == "true"
+METRICS_BUCKETS = [
+    float(bound) for bound in os.getenv("METRICS_BUCKETS", "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10").split(",")
+]
+# A directory shared by the gunicorn workers, where each of them writes its
+# counts every METRICS_FLUSH_INTERVAL seconds for a scrape to add them up
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+
+# Slow query log: statements slower than this are logged with their route
+# and kept in a ring buffer that GET /admin/slow-queries returns (0 disables).
+# SLOW_QUERY_EXPLAIN also captures the plans of the slow SELECTs, which runs
+# them again, so each one at most every SLOW_QUERY_EXPLAIN_INTERVAL seconds.
+# Only requests that send SLOW_QUERY_SECRET in an X-Slow-Queries header are
+# answered (empty never)
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", "200"))
+SLOW_QUERY_EXPLAIN = os.getenv("SLOW_QUERY_EXPLAIN", "false").lower() == "true"
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "60"))
+SLOW_QUERY_BUFFER_SIZE = int(os.getenv("SLOW_QUERY_BUFFER_SIZE", "50"))
+SLOW_QUERY_SECRET = os.getenv("SLOW_QUERY_SECRET", "")
+
+# Request profiler: samples the stack of 1 in PROFILE_SAMPLE_RATE requests
+# (0 never) and of those that send PROFILE_SECRET in an X-Profile header
+# (empty never), every PROFILE_INTERVAL_MS, into at most PROFILE_MAX_FILES
+# files in PROFILE_DIR that `flask profile-merge` adds up for a flame graph
+PROFILE_SAMPLE_RATE = int(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SECRET = os.getenv("PROFILE_SECRET", "")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/wishlist-profiles")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "1"))
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "100"))
+
+# Browser caching of the static files: hashed copies never change, while
+# the index page that refers to them is revalidated after this many seconds
+STATIC_IMMUTABLE_MAX_AGE = int(os.getenv("STATIC_IMMUTABLE_MAX_AGE", "31536000"))
+STATIC_INDEX_MAX_AGE = int(os.getenv("STATIC_INDEX_MAX_AGE", "0"))
+
+# JSON encoder: "auto" (orjson when installed), "orjson" or "stdlib"
+JSON_PROVIDER = os.getenv("JSON_PROVIDER", "auto")
 
 # Secret for session management
 SECRET_KEY = os.getenv("SECRET_KEY", "sup3r-s3cr3t")
 LOGGING_LEVEL = logging.INFO
+
+# Logging: "text" writes lines as before, "json" writes every line as a
+# JSON object with the request id, for a log collector to parse. With LOG_ASYNC the lines go through a queue of
+# LOG_QUEUE_SIZE records that a thread writes out, dropping the newest
+# ones when it is full. LOG_SAMPLE_RATES keeps a fraction of some levels,
+# like "INFO=0.1,DEBUG=0.01"
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_ASYNC = os.getenv("LOG_ASYNC", "true").lower() == "true"
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_SAMPLE_RATES = {
+    level.strip(): float(rate)
+    for level, _, rate in (pair.partition("=") for pair in os.getenv("LOG_SAMPLE_RATES", "").split(",") if pair)
+}
@@ -7,3 +7,6 @@ All of the models are stored in this package
 from .persistent_base import db, DataValidationError
 from .wishlist import Wishlist
 from .item import Item
+from .duplicate_job import DuplicateJob
+from .replicas import replicas, read_from_replica
+from .migrations import check_schema, migrate, SchemaVersionError, SCHEMA_VERSION
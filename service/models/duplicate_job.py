@@ -0,0 +1,64 @@
+"""
+Models for Wishlist
+
+All of the models are stored in this module
+"""
+
+import logging
+from .persistent_base import db, PersistentBase, DataValidationError
+
+logger = logging.getLogger("flask.app")
+
+
+class DuplicateJob(db.Model, PersistentBase):
+    """Class that represents a Wishlist duplication running in the background"""
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    id = db.Column(db.Integer, primary_key=True)
+    source_id = db.Column(db.Integer, nullable=False)
+    wishlist_id = db.Column(db.Integer, nullable=True)
+    status = db.Column(db.String(16), nullable=False, default=PENDING)
+    message = db.Column(db.String(250), nullable=True)
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+
+    def __repr__(self):
+        return f"<DuplicateJob {self.source_id} id=[{self.id}]>"
+
+    def __str__(self):
+        return f"{self.id}: {self.source_id} {self.status}"
+
+    def serialize(self):
+        """Serializes a duplicate job into a dictionary"""
+        return {
+            "id": self.id,
+            "source_id": self.source_id,
+            "wishlist_id": self.wishlist_id,
+            "status": self.status,
+            "message": self.message,
+        }
+
+    def deserialize(self, data):
+        """
+        Deserializes a duplicate job from a dictionary
+        Args:
+            data (dict): A dictionary containing the job data
+        """
+        try:
+            self.source_id = data["source_id"]
+            self.wishlist_id = data.get("wishlist_id")
+            self.status = data.get("status", self.PENDING)
+            self.message = data.get("message")
+        except KeyError as error:
+            raise DataValidationError(
+                "Invalid duplicate job: missing " + error.args[0]
+            ) from error
+        except (AttributeError, TypeError) as error:
+            raise DataValidationError(
+                "Invalid duplicate job: body of request contained bad or no data "
+                + str(error)
+            ) from error
+        return self
@@ -5,7 +5,9 @@ All of the models are stored in this module
 """
 
 import logging
+from sqlalchemy import inspect, select
 from .persistent_base import db, PersistentBase, DataValidationError
+from .search import add_fts5_index, document
 
 logger = logging.getLogger("flask.app")
 
@@ -25,6 +27,13 @@ class Item(db.Model, PersistentBase):
     wishlist_id = db.Column(
         db.Integer, db.ForeignKey("wishlist.id", ondelete="CASCADE"), nullable=False
     )
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+
+    __table_args__ = (
+        db.Index(
+            "ix_item_search", document(item_name), postgresql_using="gin"
+        ).ddl_if(dialect="postgresql"),
+    )
 
     def __repr__(self):
         return f"<Item {self.item_name} id=[{self.id}]>"
@@ -40,6 +49,21 @@ class Item(db.Model, PersistentBase):
             "item_name": self.item_name,
         }
 
+    @staticmethod
+    def serialize_row(row):
+        """Serializes an item straight from a Core row, like serialize() does"""
+        return {
+            "id": row.id,
+            "wishlist_id": row.wishlist_id,
+            "item_name": row.item_name,
+        }
+
+    def cache_keys(self):
+        """Returns the cache keys of the item and of the wishlists that embed it"""
+        previous_ids = inspect(self).attrs.wishlist_id.history.deleted
+        wishlist_ids = {self.wishlist_id, *previous_ids}
+        return super().cache_keys() + [("wishlist", by_id) for by_id in wishlist_ids]
+
     def deserialize(self, data):
         """
         Deserializes a item from a dictionary
@@ -60,3 +84,42 @@ class Item(db.Model, PersistentBase):
                 "Invalid item: body of request contained bad or no data " + str(error)
             ) from error
         return self
+
+    ##################################################
+    # CLASS METHODS
+    ##################################################
+
+    @classmethod
+    def find_by_wishlist_id(cls, wishlist_id, query=None):
+        """Returns all Items that belong to the given Wishlist
+
+        Args:
+            wishlist_id (int): the id of the Wishlist that owns the items
+            query (Query): the query to narrow down, or None for all Items
+        """
+        logger.info("Processing wishlist query for %s ...", wishlist_id)
+        query = cls.query if query is None else query
+        return query.filter(cls.wishlist_id == wishlist_id)
+
+    @classmethod
+    def find_rows_by_wishlist_id(cls, wishlist_id):
+        """Returns the Core rows of the Items of a Wishlist, without instances
+
+        Args:
+            wishlist_id (int): the id of the Wishlist that owns the items
+        """
+        logger.info("Processing wishlist row query for %s ...", wishlist_id)
+        return db.session.execute(cls.select_rows_by_wishlist_id(wishlist_id))
+
+    @classmethod
+    def select_rows_by_wishlist_id(cls, wishlist_id):
+        """Returns the Core select of the rows of the Items of a Wishlist, for any session"""
+        table = cls.__table__
+        return (
+            select(table.c.id, table.c.wishlist_id, table.c.item_name)
+            .where(table.c.wishlist_id == wishlist_id)
+            .order_by(table.c.id)
+        )
+
+
+add_fts5_index(Item.__table__, "item_name")
@@ -0,0 +1,178 @@
+"""
+Versioned Schema Migrations
+
+The schema of the primary is changed by `flask db-migrate`, which applies
+every migration newer than the version recorded in the schema_version
+table, in order and in one transaction. App startup only reads that
+version, instead of checking every table and index in every worker.
+
+The first migration creates the tables as the models define them now, so
+every later one only changes what is not already there. This also lets a
+database that create_all built before migrations existed be adopted:
+its migrations find nothing left to do and are recorded.
+"""
+
+import logging
+from datetime import datetime, timezone
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, exc, func, inspect, select, text
+from sqlalchemy.schema import CreateIndex
+from .persistent_base import db
+from .wishlist import Wishlist
+from .item import Item
+from .duplicate_job import DuplicateJob
+from .search import fts5_ddl
+
+logger = logging.getLogger("flask.app")
+
+# kept out of db.metadata so create_all and drop_all leave it alone
+schema_versions = Table(
+    "schema_version",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("description", String(250), nullable=False),
+    Column("applied_at", DateTime(timezone=True), nullable=False),
+)
+
+# the PostgreSQL advisory lock that serializes concurrent migrations
+MIGRATION_LOCK = 2820
+
+MIGRATIONS = []
+
+
+class SchemaVersionError(Exception):
+    """Used when the schema of the database is older than the models"""
+
+
+def migration(version, description):
+    """Registers a function of a connection as the migration to a version"""
+
+    def register(function):
+        MIGRATIONS.append((version, description, function))
+        return function
+
+    return register
+
+
+def create_index(connection, index):
+    """Creates an index unless it exists, which reflection misses for expressions on SQLite"""
+    connection.execute(CreateIndex(index, if_not_exists=True))
+
+
+######################################################################
+#  M I G R A T I O N S
+######################################################################
+@migration(1, "Create the wishlist and item tables")
+def create_tables(connection):
+    """Creates the tables of the Wishlists and their Items"""
+    for table in (Wishlist.__table__, Item.__table__):
+        table.create(connection, checkfirst=True)
+
+
+@migration(2, "Add the version columns of the ETags")
+def add_version_columns(connection):
+    """Adds the version that every change of a record increments"""
+    for table in (Wishlist.__table__, Item.__table__):
+        columns = {column["name"] for column in inspect(connection).get_columns(table.name)}
+        if "version" not in columns:
+            connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+
+
+@migration(3, "Create the duplicate_job table")
+def create_duplicate_jobs(connection):
+    """Creates the table of the background Wishlist duplications"""
+    DuplicateJob.__table__.create(connection, checkfirst=True)
+
+
+@migration(4, "Index the wishlist filters")
+def index_filters(connection):
+    """Creates the indexes of the user, title prefix and date filters"""
+    for index in Wishlist.__table__.indexes:
+        if index.name != "ix_wishlist_search":
+            create_index(connection, index)
+
+
+@migration(5, "Index the search documents")
+def index_search(connection):
+    """Creates the GIN indexes on PostgreSQL and the FTS5 tables on SQLite"""
+    if connection.dialect.name != "sqlite":
+        for table in (Wishlist.__table__, Item.__table__):
+            for index in table.indexes:
+                if index.name.endswith("_search"):
+                    create_index(connection, index)
+        return
+    for table in (Wishlist.__table__, Item.__table__):
+        name = f"{table.name}_fts"
+        if inspect(connection).has_table(name):
+            continue
+        for statement in fts5_ddl(table, table.info["fts5_columns"]):
+            connection.execute(text(statement))
+        # index the rows that were written before the table existed
+        connection.execute(text(f"INSERT INTO {name}({name}) VALUES ('rebuild')"))
+
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+######################################################################
+#  M I G R A T I O N   R U N N E R
+######################################################################
+def schema_version(connection) -> int:
+    """Returns the version of the schema, or 0 when it was never migrated"""
+    try:
+        return connection.execute(select(func.max(schema_versions.c.version))).scalar() or 0
+    except (exc.ProgrammingError, exc.OperationalError):
+        # the schema_version table does not exist yet
+        connection.rollback()
+        return 0
+
+
+def migrate(connection, target=None) -> list:
+    """Applies the migrations newer than the schema in the transaction of a connection
+
+    Args:
+        connection (Connection): a connection to the primary in a transaction
+        target (int): the version to migrate to, or None for the latest one
+
+    Returns:
+        list: the (version, description) of the migrations that were applied
+    """
+    if connection.dialect.name == "postgresql":
+        # a second pod that migrates at the same time waits, then finds nothing to do
+        connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK})
+    schema_versions.create(connection, checkfirst=True)
+    current = connection.execute(select(func.max(schema_versions.c.version))).scalar() or 0
+    target = SCHEMA_VERSION if target is None else target
+    applied = []
+    for version, description, function in MIGRATIONS:
+        if current < version <= target:
+            logger.info("Migrating the schema to version %d: %s", version, description)
+            function(connection)
+            connection.execute(
+                schema_versions.insert().values(
+                    version=version, description=description, applied_at=datetime.now(timezone.utc)
+                )
+            )
+            applied.append((version, description))
+    return applied
+
+
+def check_schema(app) -> int:
+    """Makes sure the schema of the primary is as new as the models
+
+    The schema is migrated when DB_MIGRATE_ON_START is set, otherwise a
+    SchemaVersionError is raised for `flask db-migrate` to be run first
+    """
+    with db.engine.connect() as connection:
+        version = schema_version(connection)
+    if version > SCHEMA_VERSION:
+        # the previous release keeps serving while a rolling update finishes
+        app.logger.warning("Schema version %d is newer than %d", version, SCHEMA_VERSION)
+    elif version < SCHEMA_VERSION:
+        if not app.config["DB_MIGRATE_ON_START"]:
+            raise SchemaVersionError(
+                f"Schema version {version} is older than {SCHEMA_VERSION}, run flask db-migrate"
+            )
+        with db.engine.begin() as connection:
+            migrate(connection)
+        version = SCHEMA_VERSION
+    return version
@@ -4,11 +4,16 @@ Persistent Base class for database CRUD functions
 
 import logging
 from abc import abstractmethod
+from flask import current_app
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, load_only
+from service.common.cache import cache
+from service.models.replicas import RoutingSession, reading_from_replica
 
 logger = logging.getLogger("flask.app")
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 
 class DataValidationError(Exception):
@@ -18,7 +23,7 @@ class DataValidationError(Exception):
 ######################################################################
 #  P E R S I S T E N T   B A S E   M O D E L
 ######################################################################
-class PersistentBase:
+class PersistentBase:  # pylint: disable=too-many-public-methods
     """Base class added persistent methods"""
 
     def __init__(self):
@@ -36,52 +41,219 @@ class PersistentBase:
         """
         Creates a Wishlist to the database
         """
-        logger.info("Creating %s", self)
+        logger.info("Creating a %s record", type(self).__name__)
         # id must be none to generate next primary key
         self.id = None
+        stale_keys = self.cache_keys() if cache.enabled else []
         try:
             db.session.add(self)
+            cache.publish(db.session, stale_keys)
             db.session.commit()
         except Exception as e:
             db.session.rollback()
-            logger.error("Error creating record: %s", self)
+            logger.error("Error creating a %s record", type(self).__name__)
             raise DataValidationError(e) from e
+        cache.invalidate(*stale_keys)
+
+    @classmethod
+    def create_many(cls, records: list) -> list:
+        """
+        Creates many records in one transaction and returns them serialized
+
+        The unit of work inserts them with one INSERT ... RETURNING per table
+        """
+        logger.info("Creating %d %s records", len(records), cls.__name__)
+        stale_keys = []
+        if cache.enabled:
+            stale_keys = list({key for record in records for key in record.cache_keys()})
+        try:
+            db.session.add_all(records)
+            db.session.flush()
+            results = [record.serialize() for record in records]
+            cache.publish(db.session, stale_keys)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error creating %d %s records", len(records), cls.__name__)
+            raise DataValidationError(e) from e
+        cache.invalidate(*stale_keys)
+        return results
 
     def update(self) -> None:
         """
         Updates a resource to the database
         """
-        logger.info("Updating %s", self)
+        logger.info("Updating %s %s", type(self).__name__, self.id)
         if not self.id:
             raise DataValidationError("Update called with empty ID field")
+        stale_keys = self.cache_keys() if cache.enabled else []
         try:
+            cache.publish(db.session, stale_keys)
             db.session.commit()
         except Exception as e:
             db.session.rollback()
-            logger.error("Error updating record: %s", self)
+            logger.error("Error updating %s %s", type(self).__name__, self.id)
             raise DataValidationError(e) from e
+        cache.invalidate(*stale_keys)
 
     def delete(self) -> None:
         """Removes a Wishlist from the data store"""
-        logger.info("Deleting %s", self)
+        logger.info("Deleting %s %s", type(self).__name__, self.id)
+        stale_keys = self.cache_keys() if cache.enabled else []
         try:
             db.session.delete(self)
+            cache.publish(db.session, stale_keys)
             db.session.commit()
         except Exception as e:
             db.session.rollback()
-            logger.error("Error deleting record: %s", self)
+            logger.error("Error deleting %s %s", type(self).__name__, self.id)
             raise DataValidationError(e) from e
+        cache.invalidate(*stale_keys)
 
     @classmethod
-    def all(cls):
-        """Returns all of the records in the database"""
+    def all(cls, limit=None, after=None):
+        """Returns all of the records in the database
+
+        Args:
+            limit (int): the maximum number of records to return
+            after (int): only return records with an id greater than this one
+        """
         logger.info("Processing all records")
+        return cls.paginate(cls.list_query(), limit, after).all()
+
+    @classmethod
+    def list_query(cls, fields=None, include=None):
+        """Returns a query over all of the records, ready to be listed
+
+        Args:
+            fields (list): the only columns to load besides the id, or None for all
+            include (list): the relationships to load, or None for the default ones
+        """
         # pylint: disable=no-member
-        return cls.query.all()
+        query = cls.query.options(*cls.list_loader_options(include))
+        if fields is not None:
+            query = query.options(load_only(*(getattr(cls, field) for field in fields)))
+        return query
+
+    @classmethod
+    def paginate(cls, query, limit=None, after=None):
+        """Applies keyset pagination on the primary key to a query
+
+        Args:
+            query (Query): the query to paginate
+            limit (int): the maximum number of records to return
+            after (int): only return records with an id greater than this one
+        """
+        if limit is None and after is None:
+            return query
+        if after is not None:
+            query = query.filter(cls.id > after)
+        query = query.order_by(cls.id)
+        if limit is not None:
+            query = query.limit(limit)
+        return query
+
+    @classmethod
+    def stream(cls, query, batch_size):
+        """Iterates over the records of a query through a server-side cursor
+
+        Args:
+            query (Query): the query to iterate over
+            batch_size (int): the number of rows fetched per round-trip
+        """
+        logger.info("Streaming records in batches of %d", batch_size)
+        return query.yield_per(batch_size)
 
     @classmethod
     def find(cls, by_id):
         """Finds a record by it's ID"""
         logger.info("Processing lookup for id %s ...", by_id)
         # pylint: disable=no-member
-        return cls.query.session.get(cls, by_id)
+        return cls.query.session.get(cls, by_id, options=cls.get_loader_options())
+
+    @classmethod
+    def find_many(cls, ids, fields=None, include=None):
+        """Finds the records with the given IDs in a single query
+
+        Args:
+            ids (list): the ids of the records to find
+            fields (list): the only columns to load besides the id, or None for all
+            include (list): the relationships to load, or None for the default ones
+
+        Returns:
+            dict: the records found, keyed by their id
+        """
+        logger.info("Processing lookup for %d ids ...", len(ids))
+        # pylint: disable=no-member
+        records = cls.list_query(fields, include).filter(cls.id.in_(ids)).all()
+        return {record.id: record for record in records}
+
+    @classmethod
+    def find_version(cls, by_id):
+        """Returns the version of a record without loading it, or None"""
+        logger.info("Processing version lookup for id %s ...", by_id)
+        # pylint: disable=no-member
+        return db.session.query(cls.version).filter(cls.id == by_id).scalar()
+
+    @classmethod
+    def find_cached(cls, by_id):
+        """Returns the cached (version, body) of a record, or None"""
+        return cache.get((cls.__table__.name, by_id))
+
+    @classmethod
+    def find_row(cls, by_id):
+        """Returns the Core row of a record without building an instance, or None"""
+        logger.info("Processing row lookup for id %s ...", by_id)
+        return db.session.execute(cls.select_row(by_id)).first()
+
+    @classmethod
+    def select_row(cls, by_id):
+        """Returns the Core select of the row of a record, for any session"""
+        table = cls.__table__
+        return select(table).where(table.c.id == by_id)
+
+    @classmethod
+    def cache_payload(cls, by_id, version, payload, generation=None) -> tuple:
+        """Encodes a payload as JSON into the cache and returns (version, body)
+
+        Cache hits then answer with the encoded body without serializing again.
+        What a replica read is not cached, as it may predate a write whose
+        invalidation already happened. Neither is a payload read before an
+        invalidation since the cache generation taken before the read
+        """
+        entry = (version, current_app.json.dumps(payload))
+        if not reading_from_replica():
+            cache.set((cls.__table__.name, by_id), entry, generation)
+        return entry
+
+    def cache_keys(self) -> list:
+        """Returns the cache keys of every payload that embeds this record"""
+        return [(self.__table__.name, self.id)]
+
+    def bump_version(self) -> None:
+        """Increments the version of the record in the database when flushed"""
+        self.version = type(self).version + 1  # pylint: disable=attribute-defined-outside-init
+
+    @classmethod
+    def list_loader_options(cls, include=None) -> list:  # pylint: disable=unused-argument
+        """Returns the relationship loader options used when listing records
+
+        Args:
+            include (list): the relationships to load, or None for the default ones
+        """
+        return []
+
+    @classmethod
+    def get_loader_options(cls) -> list:
+        """Returns the relationship loader options used when reading one record"""
+        return []
+
+
+@event.listens_for(Session, "before_flush")
+def bump_modified_versions(session, flush_context, instances):  # pylint: disable=unused-argument
+    """Increments the version of every modified record so that its ETag changes"""
+    for record in session.dirty:
+        if isinstance(record, PersistentBase) and session.is_modified(
+            record, include_collections=False
+        ):
+            record.bump_version()
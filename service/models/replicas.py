@@ -0,0 +1,146 @@
+"""
+Read Replica Routing
+
+The GET routes that are decorated with read_from_replica read from one of
+the DATABASE_REPLICA_URIS, picked round-robin. Writes and flushes always
+go to the primary, and so do the reads of a client for a short window
+after it wrote, so it sees its own changes before the replicas catch up.
+The end of the window is sent as a cookie and as an X-Read-Primary-Until
+header, which clients that keep no cookies send back with their reads.
+
+Only a replica that cannot be reached is skipped and read again from the
+primary. An error that the replica answered with, such as a statement
+timeout, is raised as it would be on the primary.
+"""
+
+import itertools
+import logging
+import threading
+import time
+from functools import wraps
+from flask import current_app, g, has_app_context, request
+from flask_sqlalchemy.session import Session as FlaskSession
+from sqlalchemy import exc
+from sqlalchemy.sql.dml import UpdateBase
+
+logger = logging.getLogger("flask.app")
+
+# the cookie and header that send the reads of a client that wrote to the primary
+PRIMARY_COOKIE = "read_primary_until"
+PRIMARY_HEADER = "X-Read-Primary-Until"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+# the SQLSTATE classes of the errors that mean the database could not be reached
+CONNECTION_SQLSTATES = ("08", "57P")
+
+
+class RoutingSession(FlaskSession):  # pylint: disable=too-few-public-methods
+    """Session that sends the reads of replica routes to their replica"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        """Returns the replica of the request for reads and the primary otherwise"""
+        replica = g.get("replica") if has_app_context() else None
+        if replica and bind is None and not self._flushing and not isinstance(clause, UpdateBase):
+            return self._db.engines[replica]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class ReplicaRouter:
+    """Picks the replica of every read round-robin, skipping failed ones"""
+
+    def __init__(self):
+        self.keys = []
+        self.window = 5
+        self.retry_interval = 30.0
+        self._turns = itertools.count()
+        self._down_until = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Configures the replicas from the settings of a Flask app"""
+        self.keys = sorted(key for key in app.config["SQLALCHEMY_BINDS"] if key.startswith("replica_"))
+        self.window = app.config["READ_YOUR_WRITES_WINDOW"]
+        self.retry_interval = app.config["REPLICA_RETRY_INTERVAL"]
+        self._down_until.clear()
+        app.after_request(self.remember_writes)
+        # streamed bodies keep reading from the replica until the request ends
+        app.teardown_request(lambda _: g.pop("replica", None))
+        if self.keys:
+            app.logger.info("Reading from %d replicas", len(self.keys))
+
+    def choose(self):
+        """Returns the bind key of the next healthy replica, or None for the primary"""
+        now = time.monotonic()
+        with self._lock:
+            for _ in self.keys:
+                key = self.keys[next(self._turns) % len(self.keys)]
+                if self._down_until.get(key, 0) <= now:
+                    return key
+        return None
+
+    def mark_down(self, key):
+        """Skips a replica that failed until it is time to try it again"""
+        logger.warning("Replica %s failed, reading from the primary for %ss", key, self.retry_interval)
+        with self._lock:
+            self._down_until[key] = time.monotonic() + self.retry_interval
+
+    def down(self) -> list:
+        """Returns the bind keys of the replicas that are being skipped"""
+        now = time.monotonic()
+        with self._lock:
+            return sorted(key for key, until in self._down_until.items() if until > now)
+
+    def wrote_recently(self) -> bool:
+        """Returns whether the client of the request wrote within the window"""
+        until = request.cookies.get(PRIMARY_COOKIE) or request.headers.get(PRIMARY_HEADER, 0)
+        try:
+            return float(until) > time.time()
+        except ValueError:
+            return False
+
+    def remember_writes(self, response):
+        """Sends the next reads of a client that wrote to the primary"""
+        if self.keys and request.method not in SAFE_METHODS and response.status_code < 400:
+            until = str(int(time.time()) + self.window)
+            response.set_cookie(PRIMARY_COOKIE, until, max_age=self.window, httponly=True, samesite="Lax")
+            response.headers[PRIMARY_HEADER] = until
+        return response
+
+
+replicas = ReplicaRouter()
+
+
+def reading_from_replica() -> bool:
+    """Returns whether the reads of the current request go to a replica"""
+    return has_app_context() and g.get("replica") is not None
+
+
+def connection_failed(error) -> bool:
+    """Returns whether an OperationalError means the database could not be reached"""
+    if error.connection_invalidated:
+        return True
+    sqlstate = getattr(error.orig, "sqlstate", None)
+    # the driver raises errors without a SQLSTATE when no server answered
+    return sqlstate is None or sqlstate.startswith(CONNECTION_SQLSTATES)
+
+
+def read_from_replica(function):
+    """Decorator that reads from a replica, falling back to the primary when it fails"""
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        key = None if replicas.wrote_recently() else replicas.choose()
+        if key is None:
+            return function(*args, **kwargs)
+        g.replica = key
+        try:
+            return function(*args, **kwargs)
+        except exc.OperationalError as error:
+            if not connection_failed(error):
+                raise
+            replicas.mark_down(key)
+            g.pop("replica")
+            # drop the connection to the replica before reading again
+            current_app.extensions["sqlalchemy"].session.rollback()
+            return function(*args, **kwargs)
+
+    return wrapper
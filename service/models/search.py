@@ -0,0 +1,114 @@
+"""
+Full Text Search for Wishlists
+
+PostgreSQL matches the terms against GIN indexed tsvector expressions of
+the wishlist title and description and of the item names. SQLite, used for
+local runs, matches them against FTS5 tables that triggers keep in sync.
+"""
+
+from functools import reduce
+from sqlalchemy import DDL, column, event, func, literal_column, select, table, union_all
+# registers the argument types of to_tsvector() and the other search functions
+from sqlalchemy.dialects import postgresql  # noqa: F401 pylint: disable=unused-import
+
+TS_CONFIG = "english"
+
+
+def document(*columns):
+    """Returns the tsvector of some text columns, as indexed by PostgreSQL"""
+    # the separator and configuration are literals, not bound parameters, so
+    # that the expression is the same as the one in the index
+    text = reduce(
+        lambda left, right: left.op("||")(literal_column("' '")).op("||")(right), columns
+    )
+    return func.to_tsvector(literal_column(f"'{TS_CONFIG}'"), text)
+
+
+def search_matches(dialect_name, wishlists, items, terms):
+    """Returns a (wishlist_id, rank) subquery of the Wishlists that match terms
+
+    A Wishlist matches when its title and description together, or the name
+    of one of its items, hold every term; its rank adds up those matches
+    """
+    if dialect_name == "sqlite":
+        matches = union_all(*fts5_matches(wishlists, items, terms)).subquery()
+    else:
+        matches = union_all(*tsvector_matches(wishlists, items, terms)).subquery()
+    return (
+        select(matches.c.wishlist_id, func.sum(matches.c.rank).label("rank"))
+        .group_by(matches.c.wishlist_id)
+        .subquery("search")
+    )
+
+
+def tsvector_matches(wishlists, items, terms):
+    """Returns the PostgreSQL selects of the wishlists and items that match"""
+    query = func.websearch_to_tsquery(literal_column(f"'{TS_CONFIG}'"), terms)
+    wishlist_document = document(wishlists.c.title, wishlists.c.description)
+    item_document = document(items.c.item_name)
+    return (
+        select(
+            wishlists.c.id.label("wishlist_id"),
+            func.ts_rank(wishlist_document, query).label("rank"),
+        ).where(wishlist_document.op("@@")(query)),
+        select(
+            items.c.wishlist_id, func.ts_rank(item_document, query).label("rank")
+        ).where(item_document.op("@@")(query)),
+    )
+
+
+######################################################################
+#  S Q L I T E   F T S 5   F A L L B A C K
+######################################################################
+def fts5_query(terms):
+    """Quotes every search term so FTS5 matches them all, as plain words"""
+    return " ".join('"' + term.replace('"', '""') + '"' for term in terms.split())
+
+
+def fts5_matches(wishlists, items, terms):
+    """Returns the SQLite selects of the wishlists and items that match"""
+    wishlist_fts = table(f"{wishlists.name}_fts", column("rowid"))
+    item_fts = table(f"{items.name}_fts", column("rowid"))
+    query = fts5_query(terms)
+    # bm25 is lower for better matches
+    return (
+        select(
+            wishlist_fts.c.rowid.label("wishlist_id"),
+            (-func.bm25(literal_column(wishlist_fts.name))).label("rank"),
+        ).where(literal_column(wishlist_fts.name).op("MATCH")(query)),
+        select(items.c.wishlist_id, (-func.bm25(literal_column(item_fts.name))).label("rank"))
+        .join(item_fts, item_fts.c.rowid == items.c.id)
+        .where(literal_column(item_fts.name).op("MATCH")(query)),
+    )
+
+
+def fts5_ddl(source, columns):
+    """Returns the statements that index columns of a table with FTS5"""
+    name = f"{source.name}_fts"
+    names = ", ".join(columns)
+    new_values = ", ".join(f"new.{col}" for col in columns)
+    old_values = ", ".join(f"old.{col}" for col in columns)
+    insert_new = f"INSERT INTO {name}(rowid, {names}) VALUES (new.id, {new_values});"
+    delete_old = (
+        f"INSERT INTO {name}({name}, rowid, {names}) VALUES ('delete', old.id, {old_values});"
+    )
+    return [
+        f"CREATE VIRTUAL TABLE {name} USING fts5({names}, content='{source.name}', "
+        "content_rowid='id', tokenize='porter unicode61')",
+        f"CREATE TRIGGER {name}_insert AFTER INSERT ON {source.name} BEGIN {insert_new} END",
+        f"CREATE TRIGGER {name}_delete AFTER DELETE ON {source.name} BEGIN {delete_old} END",
+        f"CREATE TRIGGER {name}_update AFTER UPDATE OF {names} ON {source.name} "
+        f"BEGIN {delete_old} {insert_new} END",
+    ]
+
+
+def add_fts5_index(source, *columns):
+    """Creates and drops an FTS5 index of some columns along with a SQLite table"""
+    source.info["fts5_columns"] = columns
+    for statement in fts5_ddl(source, columns):
+        event.listen(source, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+    event.listen(
+        source,
+        "before_drop",
+        DDL(f"DROP TABLE IF EXISTS {source.name}_fts").execute_if(dialect="sqlite"),
+    )
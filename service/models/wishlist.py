@@ -4,8 +4,11 @@ Persistent Base class for database CRUD functions
 
 import logging
 from datetime import date
+from sqlalchemy import event, func, insert, inspect, literal, select
+from sqlalchemy.orm import Session, joinedload, object_session, selectinload
 from .persistent_base import db, PersistentBase, DataValidationError
 from .item import Item
+from .search import add_fts5_index, document, search_matches
 
 logger = logging.getLogger("flask.app")
 
@@ -27,26 +30,71 @@ class Wishlist(db.Model, PersistentBase):
     user_id = db.Column(db.Integer, nullable=False)
     title = db.Column(db.String(63), nullable=False)
     description = db.Column(db.String(250), nullable=False)
-    items = db.relationship("Item", backref="wishlist", passive_deletes=True)
+    items = db.relationship("Item", backref="wishlist", passive_deletes="all")
     count = db.Column(db.Integer, nullable=False)
     date = db.Column(db.Date(), nullable=False, default=date.today())
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
 
-    def serialize(self):
-        """Serializes a Wishlist into a dictionary"""
-        wishlist = {
-            "id": self.id,
-            "user_id": self.user_id,
-            "title": self.title,
-            "description": self.description,
-            # "items": self.items,
-            "count": self.count,
-            "date": self.date.isoformat(),
-            "items": [],
-        }
-        for item in self.items:
-            wishlist["items"].append(item.serialize())
+    __table_args__ = (
+        # serves "all wishlists of a user" in keyset pagination order
+        db.Index("ix_wishlist_user_id_id", "user_id", "id"),
+        # serves case-insensitive title prefix searches with LIKE 'prefix%'
+        db.Index(
+            "ix_wishlist_lower_title",
+            func.lower(title).label("lower_title"),
+            postgresql_ops={"lower_title": "text_pattern_ops"},
+        ),
+        db.Index("ix_wishlist_date", "date"),
+        db.Index(
+            "ix_wishlist_search", document(title, description), postgresql_using="gin"
+        ).ddl_if(dialect="postgresql"),
+    )
+
+    # the fields that can be picked with a sparse fieldset
+    FIELDS = ("id", "user_id", "title", "description", "count", "date")
+    INCLUDES = ("items",)
+
+    def serialize(self, fields=None, include_items=True):
+        """Serializes a Wishlist into a dictionary
+
+        Args:
+            fields (list): the only fields to serialize besides the id, or None for all
+            include_items (bool): whether to embed the items of the Wishlist
+        """
+        wishlist = {}
+        for field in self.FIELDS:
+            if fields is None or field == "id" or field in fields:
+                wishlist[field] = getattr(self, field)
+        if "date" in wishlist:
+            wishlist["date"] = wishlist["date"].isoformat()
+        if include_items:
+            wishlist["items"] = [item.serialize() for item in self.items]
         return wishlist
 
+    @staticmethod
+    def serialize_row(row, item_rows):
+        """Serializes a Wishlist straight from Core rows, like serialize() does
+
+        Args:
+            row (Row): the row of the Wishlist
+            item_rows (list): the rows of its items
+        """
+        # a Row is a tuple, so .count would be tuple.count
+        wishlist = row._mapping
+        return {
+            "id": wishlist["id"],
+            "user_id": wishlist["user_id"],
+            "title": wishlist["title"],
+            "description": wishlist["description"],
+            "count": wishlist["count"],
+            "date": wishlist["date"].isoformat(),
+            "items": [Item.serialize_row(item_row) for item_row in item_rows],
+        }
+
+    def cache_keys(self):
+        """Returns the cache keys of the Wishlist and of the items it holds"""
+        return super().cache_keys() + [("item", item.id) for item in self.items]
+
     def deserialize(self, data):
         """
         Deserializes a Wishlist from a dictionary
@@ -63,10 +111,10 @@ class Wishlist(db.Model, PersistentBase):
             self.count = data["count"]
             self.date = date.fromisoformat(data["date"])
             item_list = data.get("items", [])
-            for json_item in item_list:
-                item = Item()
-                item.deserialize(json_item)
-                self.items.append(item)
+            items = [Item().deserialize(json_item) for json_item in item_list]
+            # assigning the collection marks it as loaded on a new Wishlist, so
+            # serializing it after a flush does not query for its items
+            self.items = self.items + items
         except AttributeError as error:
             raise DataValidationError("Invalid attribute: " + error.args[0]) from error
         except KeyError as error:
@@ -78,6 +126,8 @@ class Wishlist(db.Model, PersistentBase):
                 "Invalid Wishlist: body of request contained bad or no data "
                 + str(error)
             ) from error
+        except ValueError as error:
+            raise DataValidationError("Invalid Wishlist: bad date " + str(error)) from error
         return self
 
     ##################################################
@@ -85,11 +135,182 @@ class Wishlist(db.Model, PersistentBase):
     ##################################################
 
     @classmethod
-    def find_by_title(cls, title):
+    def find_by_title(cls, title, query=None):
         """Returns all Wishlist with the given title
 
         Args:
             title (string): the title of the Wishlist you want to match
+            query (Query): the query to narrow down, or None for all Wishlists
         """
         logger.info("Processing title query for %s ...", title)
-        return cls.query.filter(cls.title == title)
+        query = cls.list_query() if query is None else query
+        return query.filter(cls.title == title)
+
+    @classmethod
+    def find_by_title_prefix(cls, prefix, query=None):
+        """Returns all Wishlist whose title starts with a prefix, ignoring case
+
+        Args:
+            prefix (string): the start of the titles you want to match
+            query (Query): the query to narrow down, or None for all Wishlists
+        """
+        logger.info("Processing title prefix query for %s ...", prefix)
+        query = cls.list_query() if query is None else query
+        # the pattern is built here rather than in SQL so the planner sees a
+        # constant prefix that it can turn into an index range
+        pattern = escape_like(prefix.lower()) + "%"
+        return query.filter(func.lower(cls.title).like(pattern, escape="\\"))
+
+    @classmethod
+    def find_by_user_id(cls, user_id, query=None):
+        """Returns all Wishlist that belong to a user
+
+        Args:
+            user_id (int): the id of the user whose Wishlists you want
+            query (Query): the query to narrow down, or None for all Wishlists
+        """
+        logger.info("Processing user_id query for %s ...", user_id)
+        query = cls.list_query() if query is None else query
+        return query.filter(cls.user_id == user_id)
+
+    @classmethod
+    def find_by_date_range(cls, start=None, end=None, query=None):
+        """Returns all Wishlist dated between two days, both included
+
+        Args:
+            start (date): the first day to match, or None for no lower bound
+            end (date): the last day to match, or None for no upper bound
+            query (Query): the query to narrow down, or None for all Wishlists
+        """
+        logger.info("Processing date range query for %s to %s ...", start, end)
+        query = cls.list_query() if query is None else query
+        if start is not None:
+            query = query.filter(cls.date >= start)
+        if end is not None:
+            query = query.filter(cls.date <= end)
+        return query
+
+    @classmethod
+    def search(cls, terms, query=None):
+        """Returns the Wishlists that match search terms, best matches first
+
+        The titles and descriptions of the Wishlists and the names of their
+        items are searched through full text indexes
+
+        Args:
+            terms (string): the words to search for
+            query (Query): the query to narrow down, or None for all Wishlists
+        """
+        logger.info("Processing search for %s ...", terms)
+        query = cls.list_query() if query is None else query
+        matches = search_matches(db.engine.dialect.name, cls.__table__, Item.__table__, terms)
+        return query.join(matches, matches.c.wishlist_id == cls.id).order_by(
+            matches.c.rank.desc(), cls.id
+        )
+
+    @classmethod
+    def duplicate(cls, by_id):
+        """Copies a Wishlist and all of its items inside the database
+
+        The copy is titled "<title> COPY", dated today, and made with two
+        INSERT ... SELECT statements in one transaction, so no items are
+        loaded into Python.
+
+        Args:
+            by_id (int): the id of the Wishlist to copy
+
+        Returns:
+            int: the id of the copy, or None if there is no such Wishlist
+        """
+        logger.info("Processing duplicate of id %s ...", by_id)
+        wishlists, items = cls.__table__, Item.__table__
+        try:
+            new_id = db.session.execute(
+                insert(wishlists)
+                .from_select(
+                    ["user_id", "title", "description", "count", "date"],
+                    select(
+                        wishlists.c.user_id,
+                        wishlists.c.title + " COPY",
+                        wishlists.c.description,
+                        wishlists.c.count,
+                        literal(date.today()),
+                    ).where(wishlists.c.id == by_id),
+                )
+                .returning(wishlists.c.id)
+            ).scalar()
+            if new_id is not None:
+                db.session.execute(
+                    insert(items).from_select(
+                        ["item_name", "wishlist_id"],
+                        select(items.c.item_name, literal(new_id)).where(
+                            items.c.wishlist_id == by_id
+                        ),
+                    )
+                )
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error("Error duplicating record: %s", by_id)
+            raise DataValidationError(e) from e
+        return new_id
+
+    @classmethod
+    def list_loader_options(cls, include=None):
+        """Loads the items of every listed Wishlist with one extra IN query
+
+        The items are not queried at all when they are not included
+        """
+        if include is None or "items" in include:
+            return [selectinload(cls.items)]
+        return []
+
+    @classmethod
+    def get_loader_options(cls):
+        """Loads the items of a single Wishlist in the same query"""
+        return [joinedload(cls.items)]
+
+
+def escape_like(value: str) -> str:
+    """Escapes the LIKE wildcards in a value with backslashes"""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+add_fts5_index(Wishlist.__table__, "title", "description")
+
+
+######################################################################
+#  V E R S I O N   T R A C K I N G
+######################################################################
+def stale_wishlist_ids(item) -> set:
+    """Returns the ids of the Wishlists that the current flush has changed"""
+    return object_session(item).info.setdefault("stale_wishlist_ids", set())
+
+
+@event.listens_for(Item, "after_insert")
+@event.listens_for(Item, "before_delete")
+def track_item_change(mapper, connection, item):  # pylint: disable=unused-argument
+    """Marks the Wishlist of an item that is added or removed as changed"""
+    stale_wishlist_ids(item).add(item.wishlist_id)
+
+
+@event.listens_for(Item, "after_update")
+def track_item_update(mapper, connection, item):  # pylint: disable=unused-argument
+    """Marks the Wishlists that an updated item belongs to as changed"""
+    state = inspect(item)
+    if any(state.attrs[column.key].history.has_changes() for column in mapper.column_attrs):
+        previous_ids = state.attrs.wishlist_id.history.deleted
+        stale_wishlist_ids(item).update({item.wishlist_id, *previous_ids})
+
+
+@event.listens_for(Session, "after_flush")
+def bump_wishlist_versions(session, flush_context):  # pylint: disable=unused-argument
+    """Increments the version of every changed Wishlist with a single UPDATE"""
+    wishlist_ids = session.info.pop("stale_wishlist_ids", None)
+    if wishlist_ids:
+        table = Wishlist.__table__
+        session.connection().execute(
+            table.update()
+            .where(table.c.id.in_(wishlist_ids))
+            .values(version=table.c.version + 1)
+        )
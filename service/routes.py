@@ -20,16 +20,30 @@ Wishlist Store Service
 This service implements a REST API that allows you to Create, Read, Update
 and Delete Wishlist from the inventory of wishlists in the WishlistShop
 """
-from datetime import date
-from flask import jsonify, request, url_for, abort
+from concurrent.futures import ThreadPoolExecutor
+from operator import methodcaller
+from flask import jsonify, request, url_for, abort, Response, stream_with_context
 from flask import current_app as app  # Import Flask application
+from service.models import db, replicas, read_from_replica, DataValidationError, DuplicateJob
 from service.models.item import Item
 from service.models.wishlist import Wishlist
 from service.common import status  # HTTP Status Codes
+from service.common.assets import send_index
+from service.common.cache import cache
+from service.common.metrics import metrics, timed, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from service.common.pool import pool_stats
+from service.common.query_args import filter_wishlists, get_projection_args, next_page_link
+from service.common.query_args import get_page_args, get_position_args, to_integer
+from service.common.slow_queries import slow_queries, HEADER as SLOW_QUERIES_HEADER
+
+# the duplicates accepted with ?async=true run on these threads, a few at a time
+background = ThreadPoolExecutor(app.config["BACKGROUND_WORKERS"], thread_name_prefix="background")
 
 
 # app = app(__name__)
 
+NDJSON_MIMETYPE = "application/x-ndjson"
+
 
 ######################################################################
 # GET HEALTH CHECK
@@ -40,6 +54,43 @@ def health_check():
     return jsonify(status=200, message="Healthy"), status.HTTP_200_OK
 
 
+######################################################################
+# GET CONNECTION POOL STATISTICS
+######################################################################
+@app.route("/health/pool")
+def get_pool_stats():
+    """Returns the connection pool statistics of the worker that answers"""
+    stats = pool_stats(db.engine)
+    if replicas.keys:
+        stats["replicas"] = {key: pool_stats(db.engines[key]) for key in replicas.keys}
+        stats["replicas_down"] = replicas.down()
+    return jsonify(stats), status.HTTP_200_OK
+
+
+######################################################################
+# GET REQUEST METRICS
+######################################################################
+@app.route("/metrics")
+def get_metrics():
+    """Returns the request counters and latency histograms for Prometheus"""
+    if not metrics.enabled:
+        error(status.HTTP_404_NOT_FOUND, "Metrics are disabled")
+    return Response(metrics.render(), status=status.HTTP_200_OK, content_type=METRICS_CONTENT_TYPE)
+
+
+######################################################################
+# GET SLOW QUERIES
+######################################################################
+@app.route("/admin/slow-queries")
+def list_slow_queries():
+    """Returns the latest slow statements of the worker that answers"""
+    if slow_queries.threshold <= 0 or not slow_queries.secret:
+        error(status.HTTP_404_NOT_FOUND, "The slow query log is disabled")
+    if not slow_queries.authorized(request.headers.get(SLOW_QUERIES_HEADER)):
+        error(status.HTTP_403_FORBIDDEN, f"The {SLOW_QUERIES_HEADER} header does not hold the secret")
+    return jsonify(slow_queries.entries()), status.HTTP_200_OK
+
+
 ######################################################################
 # GET INDEX
 ######################################################################
@@ -53,7 +104,7 @@ def index():
     #         and the items (/wishlists/ { wishlist_id }/items) within them. """,
     #     status.HTTP_200_OK,
     # )
-    return app.send_static_file("index.html")
+    return send_index()
 
 
 ######################################################################
@@ -83,25 +134,100 @@ def create_wishlists():
     return jsonify(message), status.HTTP_201_CREATED, {"Location": location_url}
 
 
+# Create many wishlists
+@app.route("/wishlists:batch", methods=["POST"])
+def create_wishlists_batch():
+    """
+    Creates many Wishlists
+
+    This endpoint will create every Wishlist in the array that is posted in
+    one transaction, or none of them if any of them is invalid
+    """
+    app.logger.info("Request to create a batch of wishlists")
+    check_content_type("application/json")
+
+    wishlists, errors = deserialize_batch(Wishlist, request.get_json())
+    if errors:
+        return batch_errors(errors)
+    results = Wishlist.create_many(wishlists)
+
+    app.logger.info("Created %d wishlists.", len(results))
+    return jsonify(results), status.HTTP_201_CREATED
+
+
 # List wishlist
 @app.route("/wishlists", methods=["GET"])
+@read_from_replica
 def list_wishlists():
     """Returns all of the Wishlists"""
     app.logger.info("Request for Wishlist list")
     wishlists = []
 
     # Process the query string if any
-
-    title = request.args.get("title")
-    if title:
-        wishlists = Wishlist.find_by_title(title)
-    else:
-        wishlists = Wishlist.all()
+    if "ids" in request.args:
+        # a lookup returns whole Wishlists, as it did before ?include= existed
+        fields, include = get_projection_args(request, Wishlist, default_include=Wishlist.INCLUDES)
+        return lookup_wishlists(get_ids_arg(), fields, include)
+    fields, include = get_projection_args(request, Wishlist)
+    mimetype = streaming_mimetype()
+    limit, after = get_page_args(request, app.config["PAGINATION_MAX_LIMIT"], page_size(mimetype))
+
+    query = filter_wishlists(request, Wishlist.list_query(fields, include))
+    query = Wishlist.paginate(query, limit, after)
+
+    def serialize(wishlist):
+        return wishlist.serialize(fields, "items" in include)
+
+    if mimetype:
+        records = Wishlist.stream(query, app.config["STREAM_BATCH_SIZE"])
+        return stream_response(records, mimetype, serialize)
+    with timed("orm"):
+        wishlists = query.all()
 
     # Return as an array of dictionaries
-    results = [wishlist.serialize() for wishlist in wishlists]
+    with timed("serialize"):
+        results = [serialize(wishlist) for wishlist in wishlists]
+
+    return jsonify(results), status.HTTP_200_OK, next_page_link(request, results, limit)
+
+
+# Search wishlist
+@app.route("/wishlists/search", methods=["GET"])
+@read_from_replica
+def search_wishlists():
+    """
+    Search the Wishlists
 
-    return jsonify(results), status.HTTP_200_OK
+    This endpoint returns the Wishlists whose title, description or items
+    match the ?q= terms, best matches first, a page at a time
+    """
+    terms = request.args.get("q", "").strip()
+    app.logger.info("Request to search wishlists for %s", terms)
+    if not terms:
+        error(status.HTTP_400_BAD_REQUEST, "q must hold the terms to search for")
+
+    fields, include = get_projection_args(request, Wishlist)
+    limit, offset = get_position_args(request, app.config["PAGINATION_MAX_LIMIT"], app.config["SEARCH_PAGE_SIZE"])
+    query = Wishlist.search(terms, filter_wishlists(request, Wishlist.list_query(fields, include)))
+    wishlists = query.offset(offset).limit(limit).all()
+
+    results = [wishlist.serialize(fields, "items" in include) for wishlist in wishlists]
+    # ranked results are paged by position rather than by id
+    headers = next_page_link(request, results, limit, offset + len(results))
+    return jsonify(results), status.HTTP_200_OK, headers
+
+
+def lookup_wishlists(wishlist_ids, fields, include):
+    """Returns many Wishlists by id, in the order they were asked for"""
+    app.logger.info("Request for %d Wishlists by id", len(wishlist_ids))
+    found = Wishlist.find_many(wishlist_ids, fields, include)
+    results = [
+        found[by_id].serialize(fields, "items" in include)
+        for by_id in wishlist_ids
+        if by_id in found
+    ]
+    not_found = [by_id for by_id in wishlist_ids if by_id not in found]
+    return jsonify(wishlists=results, not_found=not_found), status.HTTP_200_OK
 
 
 # Update wishlist
@@ -150,6 +276,7 @@ def delete_wishlists(wishlist_id):
 
 # Read wishlist
 @app.route("/wishlists/<int:wishlist_id>", methods=["GET"])
+@read_from_replica
 def get_wishlists(wishlist_id):
     """
     Retrieve a single Wishlist
@@ -158,15 +285,31 @@ def get_wishlists(wishlist_id):
     """
     app.logger.info("Request for wishlist with id: %s", wishlist_id)
 
-    wishlist = Wishlist.find(wishlist_id)
-    if not wishlist:
-        error(
-            status.HTTP_404_NOT_FOUND,
-            f"Wishlist with id '{wishlist_id}' was not found.",
-        )
-
-    app.logger.info("Returning wishlist: %s", wishlist.title)
-    return jsonify(wishlist.serialize()), status.HTTP_200_OK
+    # taken before the read, so a write that commits meanwhile keeps it out of the cache
+    generation = cache.generation()
+    entry = Wishlist.find_cached(wishlist_id)
+    if entry is None:
+        # Build the payload from Core rows rather than ORM instances
+        row = Wishlist.find_row(wishlist_id)
+        if row is None:
+            error(
+                status.HTTP_404_NOT_FOUND,
+                f"Wishlist with id '{wishlist_id}' was not found.",
+            )
+        # Answer conditional requests before reading the items
+        if etag_matches(make_etag(wishlist_id, row.version)):
+            return not_modified(make_etag(wishlist_id, row.version))
+
+        payload = Wishlist.serialize_row(row, Item.find_rows_by_wishlist_id(wishlist_id))
+        entry = Wishlist.cache_payload(wishlist_id, row.version, payload, generation)
+
+    version, body = entry
+    etag = make_etag(wishlist_id, version)
+    if etag_matches(etag):
+        return not_modified(etag)
+
+    app.logger.info("Returning wishlist: %s", wishlist_id)
+    return json_response(body, etag)
 
 
 # Duplicate wishlist
@@ -175,30 +318,62 @@ def duplicate_wishlists(wishlist_id):
     """
     Duplicate a Wishlist
 
-    This endpoint will delete a Wishlist based the id specified in the path
+    This endpoint will copy a Wishlist and its items inside the database.
+    With ?async=true it returns 202 Accepted and a job to poll instead.
     """
     app.logger.info("Request to duplicate wishlist %s", wishlist_id)
 
-    old_wishlist = Wishlist.find(wishlist_id)
-    if not old_wishlist:
+    if request.args.get("async", "").lower() == "true":
+        if Wishlist.find_version(wishlist_id) is None:
+            abort(
+                status.HTTP_404_NOT_FOUND,
+                f"Wishlist {wishlist_id} does not exist",
+            )
+        job = DuplicateJob().deserialize({"source_id": wishlist_id})
+        job.create()
+        run_in_background(run_duplicate_job, app._get_current_object(), job.id)
+        location_url = url_for("get_duplicate_jobs", job_id=job.id, _external=True)
+        app.logger.info("Duplicate job %d for wishlist %s accepted.", job.id, wishlist_id)
+        return jsonify(job.serialize()), status.HTTP_202_ACCEPTED, {"Location": location_url}
+
+    new_id = Wishlist.duplicate(wishlist_id)
+    if new_id is None:
         abort(
             status.HTTP_404_NOT_FOUND,
             f"Wishlist {wishlist_id} does not exist",
         )
+    message = Wishlist.serialize_row(Wishlist.find_row(new_id), Item.find_rows_by_wishlist_id(new_id))
 
-    wishlist_new = Wishlist()
-    wishlist_new.deserialize(old_wishlist.serialize())
-    wishlist_new.title = old_wishlist.title + " COPY"
-    wishlist_new.date = str(date.today())
-    wishlist_new.create()
-    message = wishlist_new.serialize()
+    location_url = url_for("get_wishlists", wishlist_id=new_id, _external=True)
 
-    location_url = url_for("get_wishlists", wishlist_id=wishlist_new.id, _external=True)
-
-    app.logger.info("Wishlist duplicated with ID: %d created.", wishlist_new.id)
+    app.logger.info("Wishlist duplicated with ID: %d created.", new_id)
     return jsonify(message), status.HTTP_201_CREATED, {"Location": location_url}
 
 
+######################################################################
+# READ A DUPLICATE JOB
+######################################################################
+@app.route("/wishlists/duplicates/<int:job_id>", methods=["GET"])
+def get_duplicate_jobs(job_id):
+    """
+    Retrieve the status of a background duplicate
+
+    Once the job is done the Location header points at the new Wishlist
+    """
+    app.logger.info("Request for duplicate job with id: %s", job_id)
+
+    job = DuplicateJob.find(job_id)
+    if not job:
+        abort(status.HTTP_404_NOT_FOUND, f"Duplicate job with id '{job_id}' was not found.")
+
+    headers = {}
+    if job.status == DuplicateJob.DONE:
+        headers["Location"] = url_for(
+            "get_wishlists", wishlist_id=job.wishlist_id, _external=True
+        )
+    return jsonify(job.serialize()), status.HTTP_200_OK, headers
+
+
 ######################################################################
 #  R E S T   A P I   E N D P O I N T S FOR ITEM
 ######################################################################
@@ -237,24 +412,70 @@ def create_wishlist_items(wishlist_id):
     return jsonify(message), status.HTTP_201_CREATED
 
 
+# Create many items in wishlist
+@app.route("/wishlists/<int:wishlist_id>/items:batch", methods=["POST"])
+def create_wishlist_items_batch(wishlist_id):
+    """
+    Create many items on a wishlist
+
+    This endpoint will add every item in the array that is posted to a
+    wishlist in one transaction, or none of them if any of them is invalid
+    """
+    app.logger.info("Request to create a batch of Items for Wishlist with id: %s", wishlist_id)
+    check_content_type("application/json")
+
+    if Wishlist.find_version(wishlist_id) is None:
+        abort(
+            status.HTTP_404_NOT_FOUND,
+            f"Wishlist with id '{wishlist_id}' could not be found.",
+        )
+
+    items, errors = deserialize_batch(Item, request.get_json())
+    if errors:
+        return batch_errors(errors)
+    for item in items:
+        item.wishlist_id = wishlist_id
+    results = Item.create_many(items)
+
+    app.logger.info("Created %d items for Wishlist with id: %s", len(results), wishlist_id)
+    return jsonify(results), status.HTTP_201_CREATED
+
+
 # List an item in wishlist
 @app.route("/wishlists/<int:wishlist_id>/items", methods=["GET"])
+@read_from_replica
 def list_items(wishlist_id):
     """Returns all of the Items for a Wishlist"""
     app.logger.info("Request for all Items for Wishlist with id: %s", wishlist_id)
 
     # See if the account exists and abort if it doesn't
-    wishlist = Wishlist.find(wishlist_id)
-    if not wishlist:
+    version = Wishlist.find_version(wishlist_id)
+    if version is None:
         abort(
             status.HTTP_404_NOT_FOUND,
             f"Wishlist with id '{wishlist_id}' could not be found.",
         )
 
     # Get the items for the wishlist
-    results = [item.serialize() for item in wishlist.items]
-
-    return jsonify(results), status.HTTP_200_OK
+    mimetype = streaming_mimetype()
+    limit, after = get_page_args(request, app.config["PAGINATION_MAX_LIMIT"], page_size(mimetype))
+    items = Item.paginate(Item.find_by_wishlist_id(wishlist_id), limit, after)
+    if mimetype:
+        records = Item.stream(items, app.config["STREAM_BATCH_SIZE"])
+        return stream_response(records, mimetype)
+
+    # Every change to an item also changes the version of its wishlist
+    etag = make_etag(wishlist_id, version)
+    if etag_matches(etag):
+        return not_modified(etag)
+    with timed("orm"):
+        items = items.all()
+    with timed("serialize"):
+        results = [item.serialize() for item in items]
+
+    response = jsonify(results)
+    response.set_etag(etag)
+    return response, status.HTTP_200_OK, next_page_link(request, results, limit)
 
 
 # Update an item in wishlist
@@ -308,6 +529,7 @@ def delete_items(wishlist_id, item_id):
 
 # Read an item in wishlist
 @app.route("/wishlists/<int:wishlist_id>/items/<int:item_id>", methods=["GET"])
+@read_from_replica
 def get_items(wishlist_id, item_id):
     """
     Get an Item
@@ -319,14 +541,23 @@ def get_items(wishlist_id, item_id):
     )
 
     # See if the item exists and abort if it doesn't
-    item = Item.find(item_id)
-    if not item:
-        abort(
-            status.HTTP_404_NOT_FOUND,
-            f"Wishlist with id '{item_id}' could not be found.",
-        )
+    generation = cache.generation()
+    entry = Item.find_cached(item_id)
+    if entry is None:
+        row = Item.find_row(item_id)
+        if row is None:
+            abort(
+                status.HTTP_404_NOT_FOUND,
+                f"Wishlist with id '{item_id}' could not be found.",
+            )
+        entry = Item.cache_payload(item_id, row.version, Item.serialize_row(row), generation)
 
-    return jsonify(item.serialize()), status.HTTP_200_OK
+    version, body = entry
+    etag = make_etag(item_id, version)
+    if etag_matches(etag):
+        return not_modified(etag)
+
+    return json_response(body, etag)
 
 
 ######################################################################
@@ -353,7 +584,165 @@ def check_content_type(content_type):
     )
 
 
+def deserialize_batch(model, data):
+    """Deserializes an array of records and collects the errors of each one
+
+    Returns:
+        (list, list): the deserialized records and a list of errors that
+        carry the index of the element they were found in
+    """
+    if not isinstance(data, list):
+        error(status.HTTP_400_BAD_REQUEST, "Request body must be a JSON array")
+    if len(data) > app.config["BATCH_MAX_SIZE"]:
+        error(
+            status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            f"A batch may hold at most {app.config['BATCH_MAX_SIZE']} records",
+        )
+    records, errors = [], []
+    for position, element in enumerate(data):
+        try:
+            records.append(model().deserialize(element))
+        except DataValidationError as err:
+            errors.append({"index": position, "message": str(err)})
+    return records, errors
+
+
+def batch_errors(errors):
+    """Returns a 400 Bad Request response listing the invalid elements of a batch"""
+    app.logger.warning("Rejected batch with %d invalid records", len(errors))
+    return (
+        jsonify(
+            status=status.HTTP_400_BAD_REQUEST,
+            error="Bad Request",
+            message=f"{len(errors)} records in the batch are invalid",
+            errors=errors,
+        ),
+        status.HTTP_400_BAD_REQUEST,
+    )
+
+
+def get_ids_arg():
+    """Returns the distinct ids of the ?ids=1,2,3 query parameter, in order"""
+    try:
+        ids = list(dict.fromkeys(to_integer(by_id) for by_id in request.args.get("ids", "").split(",")))
+    except ValueError:
+        error(status.HTTP_400_BAD_REQUEST, "ids must be a comma separated list of integers")
+    if len(ids) > app.config["BATCH_MAX_SIZE"]:
+        error(
+            status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            f"At most {app.config['BATCH_MAX_SIZE']} ids may be looked up at once",
+        )
+    return ids
+
+
+def page_size(mimetype):
+    """Returns the page size of a listing without ?limit=, which a stream does not have"""
+    return None if mimetype else app.config["PAGINATION_DEFAULT_LIMIT"]
+
+
+def streaming_mimetype():
+    """Returns the mimetype to stream the response in, if one was asked for
+
+    Clients ask for NDJSON with an Accept: application/x-ndjson header and
+    for a chunked JSON array with the ?stream=true query parameter. NDJSON
+    must be named and preferred to JSON: a */* wildcard, which browsers and
+    jQuery send, still gets a JSON array.
+    """
+    accept = request.accept_mimetypes
+    named = any(mimetype == NDJSON_MIMETYPE for mimetype, _ in accept)
+    if named and accept[NDJSON_MIMETYPE] > accept["application/json"]:
+        return NDJSON_MIMETYPE
+    if request.args.get("stream", "").lower() == "true":
+        return "application/json"
+    return None
+
+
+def stream_response(records, mimetype, serialize=methodcaller("serialize")):
+    """Streams serialized records as NDJSON or as a chunked JSON array
+
+    Records are written out in batches of STREAM_BATCH_SIZE as they are
+    read from the database, so the response is never held in memory.
+    A serialize function may be given to project each record.
+    """
+    ndjson = mimetype == NDJSON_MIMETYPE
+    batch_size = app.config["STREAM_BATCH_SIZE"]
+
+    def generate():
+        batch = []
+        separator = "" if ndjson else "["
+        for record in records:
+            line = app.json.dumps(serialize(record))
+            batch.append(line + "\n" if ndjson else separator + line)
+            separator = ","
+            if len(batch) >= batch_size:
+                yield "".join(batch)
+                batch = []
+        if not ndjson:
+            batch.append("]" if separator == "," else "[]")
+        yield "".join(batch)
+
+    return Response(stream_with_context(generate()), status.HTTP_200_OK, mimetype=mimetype)
+
+
+def make_etag(record_id, version):
+    """Returns the strong ETag of a version of a record"""
+    return f"{record_id}-{version}"
+
+
+def json_response(body, etag):
+    """Returns a 200 OK response with a JSON body that is already encoded"""
+    response = Response(body, status.HTTP_200_OK, mimetype="application/json")
+    response.set_etag(etag)
+    return response
+
+
+def etag_matches(etag):
+    """Returns whether the If-None-Match header of the request holds an ETag
+
+    The comparison is weak, since compressed responses carry weak ETags
+    """
+    return request.if_none_match.contains_weak(etag)
+
+
+def not_modified(etag):
+    """Returns an empty 304 Not Modified response carrying the ETag"""
+    response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    response.set_etag(etag)
+    return response
+
+
 def error(status_code, reason):
     """Logs the error and then aborts"""
     app.logger.error(reason)
     abort(status_code, reason)
+
+
+def run_in_background(target, *args):
+    """Runs a function on the background threads so the request can return
+
+    At most BACKGROUND_WORKERS functions run at once; the others wait in line
+    """
+    background.submit(target, *args)
+
+
+def run_duplicate_job(flask_app, job_id):
+    """Duplicates the source Wishlist of a job and records the outcome"""
+    with flask_app.app_context():
+        job = DuplicateJob.find(job_id)
+        try:
+            job.status = DuplicateJob.RUNNING
+            job.update()
+            job.wishlist_id = Wishlist.duplicate(job.source_id)
+            if job.wishlist_id is None:
+                job.status = DuplicateJob.FAILED
+                job.message = f"Wishlist {job.source_id} does not exist"
+            else:
+                job.status = DuplicateJob.DONE
+        except Exception as reason:  # pylint: disable=broad-except
+            # a job that is left running would be polled forever
+            flask_app.logger.exception("Duplicate job %d failed", job_id)
+            db.session.rollback()
+            job.status = DuplicateJob.FAILED
+            job.message = str(reason)[:250]
+        job.update()
+        flask_app.logger.info("Duplicate job %d finished: %s", job_id, job.status)
@@ -24,7 +24,7 @@ class WishlistFactory(factory.Factory):
     id = factory.Sequence(lambda n: n)
     user_id = factory.Sequence(lambda n: n)
     title = Faker("name")
-    description = Faker("sentence", nb_words=25)
+    description = Faker("text", max_nb_chars=250)
     count = FuzzyInteger(0, 50, step=1)
     date = FuzzyDate(date(2008, 1, 1))
     # items = FuzzyChoice(choices=[ItemFactory() for _ in range(50)])
@@ -0,0 +1,55 @@
+"""
+Test helpers shared by the test suites
+"""
+
+from contextlib import contextmanager
+from sqlalchemy import event
+from service.models import db
+
+
+@contextmanager
+def count_queries():
+    """Counts the SQL statements sent to the database inside the block
+
+    Usage:
+        with count_queries() as statements:
+            client.get("/wishlists")
+        assert len(statements) == 2
+    """
+    statements = []
+
+    def before_cursor_execute(**kwargs):
+        statements.append(kwargs["statement"])
+
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute, named=True)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+
+
+class LocalChannel:
+    """In-memory stand-in for the PostgreSQL cache invalidation channel
+
+    Every cache attached to the same LocalChannel plays the part of a
+    separate gunicorn worker. Keys are delivered as soon as they are
+    published instead of when the session commits.
+    """
+
+    def __init__(self):
+        self.subscribers = []
+        self.published = []
+
+    def publish(self, session, keys):  # pylint: disable=unused-argument
+        """Delivers keys to every subscribed cache"""
+        self.published.extend(keys)
+        for on_keys, _ in self.subscribers:
+            on_keys(*keys)
+
+    def subscribe(self, on_keys, on_reconnect):
+        """Subscribes a cache to the keys published on the channel"""
+        self.subscribers.append((on_keys, on_reconnect))
+
+    def close(self):
+        """Unsubscribes every cache"""
+        self.subscribers.clear()
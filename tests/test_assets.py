@@ -0,0 +1,98 @@
+"""
+Test cases for Static Asset Fingerprinting
+"""
+
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from wsgi import app
+from service.common import status
+from service.common.assets import build_manifest, load_assets, rewrite_references
+
+
+######################################################################
+#  S T A T I C   A S S E T   T E S T   C A S E S
+######################################################################
+class TestAssets(TestCase):
+    """Static Asset Fingerprinting Tests"""
+
+    def setUp(self):
+        self.client = app.test_client()
+        self.folder = tempfile.mkdtemp()
+        shutil.copy(os.path.join(app.static_folder, "index.html"), self.folder)
+        shutil.copytree(os.path.join(app.static_folder, "js"), os.path.join(self.folder, "js"))
+        os.mkdir(os.path.join(self.folder, "css"))
+        with open(os.path.join(self.folder, "css", "tiny.css"), "w", encoding="utf-8") as css:
+            css.write("p{}")
+        original, app.static_folder = app.static_folder, self.folder
+        self.addCleanup(load_assets, app)
+        self.addCleanup(setattr, app, "static_folder", original)
+        self.addCleanup(shutil.rmtree, self.folder)
+
+    def test_build_manifest(self):
+        """It should copy the static files to names that hold their hash"""
+        manifest = build_manifest(self.folder)
+        self.assertNotIn("index.html", manifest)
+        self.assertRegex(manifest["css/tiny.css"], r"^dist/css/tiny\.[0-9a-f]{12}\.css$")
+        with open(os.path.join(self.folder, manifest["css/tiny.css"]), encoding="utf-8") as css:
+            self.assertEqual(css.read(), "p{}")
+        with open(os.path.join(self.folder, "dist", "manifest.json"), encoding="utf-8") as source:
+            self.assertEqual(json.load(source), manifest)
+        # a changed file gets a new name and the old copy goes away
+        with open(os.path.join(self.folder, "css", "tiny.css"), "w", encoding="utf-8") as css:
+            css.write("p{margin:0}")
+        rebuilt = build_manifest(self.folder)
+        self.assertNotEqual(rebuilt["css/tiny.css"], manifest["css/tiny.css"])
+        self.assertEqual(rebuilt["js/rest_api.js"], manifest["js/rest_api.js"])
+        self.assertFalse(os.path.exists(os.path.join(self.folder, manifest["css/tiny.css"])))
+
+    def test_rewrite_references(self):
+        """It should point the references of a page at the hashed copies"""
+        page = '<link href="static/a.css"><script src = "static/b.js"></script><img src="x.png">'
+        self.assertEqual(
+            rewrite_references(page, {"a.css": "dist/a.1.css", "b.js": "dist/b.2.js"}),
+            '<link href="static/dist/a.1.css"><script src = "static/dist/b.2.js"></script><img src="x.png">',
+        )
+
+    def test_send_hashed_assets(self):
+        """It should cache hashed copies for good and other static files briefly"""
+        manifest = build_manifest(self.folder)
+        load_assets(app)
+        response = self.client.get("/static/" + manifest["css/tiny.css"])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, b"p{}")
+        self.assertTrue(response.cache_control.immutable)
+        self.assertEqual(response.cache_control.max_age, 31536000)
+        response.close()
+        response = self.client.get("/static/css/tiny.css")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(response.cache_control.immutable)
+        response.close()
+
+    def test_index(self):
+        """It should send an index page that refers to the hashed copies"""
+        manifest = build_manifest(self.folder)
+        page = self.client.get("/")
+        self.assertIn(b'src="static/js/rest_api.js"', page.data)
+        load_assets(app)
+        response = self.client.get("/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.mimetype, "text/html")
+        self.assertIn(f'src="static/{manifest["js/rest_api.js"]}"'.encode(), response.data)
+        self.assertNotIn(b'"static/js/', response.data)
+        self.assertEqual(response.cache_control.max_age, 0)
+        self.assertTrue(response.cache_control.must_revalidate)
+        self.assertNotEqual(response.headers["ETag"], page.headers["ETag"])
+
+    def test_index_not_modified(self):
+        """It should answer a revalidation of the index page with 304"""
+        response = self.client.get("/", headers={"Accept-Encoding": "gzip"})
+        etag = response.headers["ETag"]
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertTrue(etag.startswith("W/"))
+        for tag in (etag, etag[2:]):
+            response = self.client.get("/", headers={"If-None-Match": tag})
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEqual(response.data, b"")
@@ -1,13 +1,20 @@
 """
 CLI Command Extensions for Flask
 """
+import io
+import json
 import os
+import subprocess
+import sys
+import tempfile
+from collections import Counter
 from unittest import TestCase
 from unittest.mock import patch, MagicMock
 from click.testing import CliRunner
 # pylint: disable=unused-import
 from wsgi import app  # noqa: F401
-from service.common.cli_commands import db_create  # noqa: E402
+from service.common.profiling import Profiler
+from service.common.cli_commands import db_create, db_migrate, build_assets, compress_static, show_slow_queries, profile_merge  # noqa: E402,E501
 
 
 class TestFlaskCLI(TestCase):
@@ -17,9 +24,104 @@ class TestFlaskCLI(TestCase):
         self.runner = CliRunner()
 
     @patch('service.common.cli_commands.db')
-    def test_db_create(self, db_mock):
+    @patch('service.common.cli_commands.migrate')
+    @patch('service.common.cli_commands.schema_versions')
+    def test_db_create(self, versions_mock, migrate_mock, db_mock):
         """It should call the db-create command"""
         db_mock.return_value = MagicMock()
         with patch.dict(os.environ, {"FLASK_APP": "wsgi:app"}, clear=True):
             result = self.runner.invoke(db_create)
             self.assertEqual(result.exit_code, 0)
+            versions_mock.drop.assert_called_once()
+            migrate_mock.assert_called_once()
+
+    @patch('service.common.cli_commands.db')
+    @patch('service.common.cli_commands.migrate')
+    def test_db_migrate(self, migrate_mock, db_mock):
+        """It should call the db-migrate command"""
+        db_mock.return_value = MagicMock()
+        migrate_mock.return_value = [(5, "Index the search documents")]
+        with patch.dict(os.environ, {"FLASK_APP": "wsgi:app"}, clear=True):
+            result = self.runner.invoke(db_migrate, ["--to", "5"])
+            self.assertEqual(result.exit_code, 0)
+            self.assertIn("Migrated to version 5: Index the search documents", result.output)
+            self.assertEqual(migrate_mock.call_args.args[1], 5)
+            migrate_mock.return_value = []
+            result = self.runner.invoke(db_migrate)
+            self.assertIn("The schema is up to date", result.output)
+
+    @patch('service.common.cli_commands.build_manifest')
+    def test_build_assets(self, build_mock):
+        """It should call the build-assets command"""
+        build_mock.return_value = {"js/rest_api.js": "dist/js/rest_api.0123456789ab.js"}
+        with patch.dict(os.environ, {"FLASK_APP": "wsgi:app"}, clear=True):
+            result = self.runner.invoke(build_assets)
+            self.assertEqual(result.exit_code, 0)
+            self.assertIn("Fingerprinted 1 static files", result.output)
+
+    @patch('service.common.cli_commands.precompress_static')
+    def test_compress_static(self, precompress_mock):
+        """It should call the compress-static command"""
+        precompress_mock.return_value = ["index.html.gz"]
+        with patch.dict(os.environ, {"FLASK_APP": "wsgi:app"}, clear=True):
+            result = self.runner.invoke(compress_static)
+            self.assertEqual(result.exit_code, 0)
+            self.assertIn("Precompressed 1 static files", result.output)
+
+    @patch('service.common.cli_commands.urlopen')
+    def test_slow_queries(self, urlopen_mock):
+        """It should print the slow queries of a running service"""
+        entry = {
+            "time": "2024-03-01T00:00:00+00:00",
+            "duration_ms": 312.5,
+            "route": "GET /wishlists",
+            "statement": "SELECT * FROM wishlist WHERE user_id = %(user_id_1)s",
+            "parameters": {"user_id_1": "?"},
+            "plan": "Seq Scan on wishlist\nExecution Time: 310.2 ms",
+        }
+        urlopen_mock.return_value = io.BytesIO(json.dumps([entry]).encode())
+        with patch.dict(os.environ, {"FLASK_APP": "wsgi:app"}, clear=True), \
+                patch.dict(app.config, {"SLOW_QUERY_SECRET": "s3cret"}):
+            result = self.runner.invoke(show_slow_queries, ["--url", "http://wishlists:8080/"])
+            self.assertEqual(result.exit_code, 0)
+            request = urlopen_mock.call_args.args[0]
+            self.assertEqual(request.full_url, "http://wishlists:8080/admin/slow-queries")
+            self.assertEqual(request.get_header("X-slow-queries"), "s3cret")
+            self.assertIn("312.5 ms  GET /wishlists", result.output)
+            self.assertIn("| Seq Scan on wishlist", result.output)
+            urlopen_mock.return_value = io.BytesIO(b"[]")
+            result = self.runner.invoke(show_slow_queries)
+            self.assertIn("No slow queries", result.output)
+
+    def test_profile_merge(self):
+        """It should merge the request profiles into one file"""
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "out.folded")
+            with patch.dict(app.config, {"PROFILE_DIR": directory}):
+                result = self.runner.invoke(profile_merge)
+                self.assertIn("No profiles found", result.output)
+                profiler = Profiler()
+                profiler.directory = directory
+                profiler.write("GET-wishlists", Counter({"main;list;serialize": 3, "main;list": 1}))
+                result = self.runner.invoke(profile_merge, ["--route", "/wishlists", "--output", output])
+            self.assertEqual(result.exit_code, 0)
+            self.assertIn(f"Merged 1 profiles, 4 samples, into {output}", result.output)
+            self.assertIn("75.0%  serialize", result.output)
+            with open(output, encoding="utf-8") as file:
+                self.assertEqual(file.read(), "main;list 1\nmain;list;serialize 3\n")
+
+    def test_migrate_when_start_may_not(self):
+        """It should run db-migrate on an empty schema that startup may not migrate"""
+        with tempfile.TemporaryDirectory() as directory:
+            environment = {
+                **os.environ,
+                "FLASK_APP": "wsgi:app",
+                "DATABASE_URI": f"sqlite:///{os.path.join(directory, 'empty.db')}",
+                "DB_MIGRATE_ON_START": "false",
+            }
+            result = subprocess.run(
+                [sys.executable, "-m", "flask", "db-migrate"],
+                env=environment, capture_output=True, text=True, timeout=60, check=False,
+            )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn("Migrated to version 1: Create the wishlist and item tables", result.stdout)
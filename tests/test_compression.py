@@ -0,0 +1,183 @@
+"""
+Test cases for Response Compression
+"""
+
+import gzip
+import os
+import shutil
+import tempfile
+import zlib
+from unittest import TestCase, skipUnless
+from unittest.mock import patch
+from wsgi import app
+from service.common import status
+from service.common.compression import precompress_static
+from service.models import db, Wishlist
+from tests.factories import WishlistFactory
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BASE_URL = "/wishlists"
+MIMETYPES = app.config["COMPRESSION_MIMETYPES"]
+
+
+######################################################################
+#  C O M P R E S S I O N   T E S T   C A S E S
+######################################################################
+class TestCompression(TestCase):
+    """Response Compression Tests"""
+
+    @classmethod
+    def setUpClass(cls):
+        app.config["TESTING"] = True
+        app.app_context().push()
+
+    def setUp(self):
+        self.client = app.test_client()
+        db.session.query(Wishlist).delete()
+        db.session.commit()
+        for wishlist in WishlistFactory.create_batch(10):
+            wishlist.create()
+
+    def tearDown(self):
+        db.session.remove()
+
+    def test_gzip(self):
+        """It should gzip large responses for clients that accept it"""
+        plain = self.client.get(BASE_URL)
+        self.assertNotIn("Content-Encoding", plain.headers)
+        self.assertIn("Accept-Encoding", plain.headers["Vary"])
+        response = self.client.get(BASE_URL, headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(int(response.headers["Content-Length"]), len(response.data))
+        self.assertEqual(gzip.decompress(response.data), plain.data)
+
+    @skipUnless(brotli, "needs brotli")
+    def test_brotli(self):
+        """It should prefer brotli unless the client prefers gzip"""
+        plain = self.client.get(BASE_URL)
+        response = self.client.get(BASE_URL, headers={"Accept-Encoding": "gzip, br"})
+        self.assertEqual(response.headers["Content-Encoding"], "br")
+        self.assertEqual(brotli.decompress(response.data), plain.data)
+        response = self.client.get(BASE_URL, headers={"Accept-Encoding": "gzip, br;q=0.5"})
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        with patch("service.common.compression.brotli", None):
+            response = self.client.get(BASE_URL, headers={"Accept-Encoding": "br"})
+        self.assertNotIn("Content-Encoding", response.headers)
+
+    def test_small_responses(self):
+        """It should not compress responses under the size threshold"""
+        response = self.client.get(f"{BASE_URL}/0", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertNotIn("Content-Encoding", response.headers)
+        with patch.dict(app.config, {"COMPRESSION_MIN_SIZE": 10**6}):
+            response = self.client.get(BASE_URL, headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", response.headers)
+
+    def test_disabled(self):
+        """It should not compress anything when disabled"""
+        with patch.dict(app.config, {"COMPRESSION_ENABLED": False}):
+            response = self.client.get(BASE_URL, headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", response.headers)
+
+    def test_streamed(self):
+        """It should compress streamed responses chunk by chunk"""
+        plain = self.client.get(BASE_URL, query_string="stream=true")
+        decompressors = {"gzip": zlib.decompressobj(16 + zlib.MAX_WBITS)}
+        if brotli is not None:
+            decompressors["br"] = brotli.Decompressor()
+        for encoding, decompressor in decompressors.items():
+            with patch.dict(app.config, {"STREAM_BATCH_SIZE": 3}):
+                response = self.client.get(
+                    BASE_URL,
+                    query_string="stream=true",
+                    headers={"Accept-Encoding": encoding},
+                    buffered=False,
+                )
+            self.assertEqual(response.headers["Content-Encoding"], encoding)
+            self.assertNotIn("Content-Length", response.headers)
+            chunks = list(response.response)
+            response.close()
+            # every batch is flushed on its own, so it can be decoded on arrival
+            self.assertGreater(len(chunks), 4)
+            process = getattr(decompressor, "decompress", None) or decompressor.process
+            first = process(chunks[0])
+            self.assertTrue(first.startswith(b"["))
+            body = first + b"".join(process(chunk) for chunk in chunks[1:])
+            self.assertEqual(body, plain.data)
+
+    def test_weak_etag(self):
+        """It should weaken the ETag of compressed responses and still match it"""
+        url = f"{BASE_URL}/{Wishlist.all()[0].id}"
+        with patch.dict(app.config, {"COMPRESSION_MIN_SIZE": 10}):
+            response = self.client.get(url, headers={"Accept-Encoding": "gzip"})
+            self.assertEqual(response.headers["Content-Encoding"], "gzip")
+            self.assertTrue(response.headers["ETag"].startswith("W/"))
+            response = self.client.get(
+                url, headers={"Accept-Encoding": "gzip", "If-None-Match": response.headers["ETag"]}
+            )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+######################################################################
+#  S T A T I C   F I L E   T E S T   C A S E S
+######################################################################
+class TestStaticCompression(TestCase):
+    """Precompressed Static File Tests"""
+
+    def setUp(self):
+        self.client = app.test_client()
+        self.folder = tempfile.mkdtemp()
+        shutil.copy(os.path.join(app.static_folder, "index.html"), self.folder)
+        os.mkdir(os.path.join(self.folder, "css"))
+        with open(os.path.join(self.folder, "css", "tiny.css"), "w", encoding="utf-8") as css:
+            css.write("p{}")
+        shutil.copy(os.path.join(app.static_folder, "images", "newapp-icon.png"), self.folder)
+        original, app.static_folder = app.static_folder, self.folder
+        self.addCleanup(setattr, app, "static_folder", original)
+        self.addCleanup(shutil.rmtree, self.folder)
+
+    def test_precompress(self):
+        """It should write compressed copies of large text files only once"""
+        written = precompress_static(self.folder, MIMETYPES, min_size=100)
+        index = os.path.join(self.folder, "index.html")
+        expected = [index + ".gz", index + ".br"] if brotli else [index + ".gz"]
+        self.assertCountEqual(written, expected)
+        self.assertEqual(precompress_static(self.folder, MIMETYPES, min_size=100), [])
+        os.utime(index, (os.path.getmtime(index) + 10,) * 2)
+        self.assertCountEqual(precompress_static(self.folder, MIMETYPES, min_size=100), expected)
+
+    def test_send_precompressed(self):
+        """It should send the precompressed copy of a static file"""
+        plain = self.client.get("/static/index.html")
+        self.assertNotIn("Content-Encoding", plain.headers)
+        precompress_static(self.folder, MIMETYPES, min_size=100)
+        decompressors = {"gzip": gzip.decompress}
+        if brotli is not None:
+            decompressors["br"] = brotli.decompress
+        for encoding, decompress in decompressors.items():
+            response = self.client.get("/static/index.html", headers={"Accept-Encoding": encoding})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response.headers["Content-Encoding"], encoding)
+            self.assertEqual(response.mimetype, "text/html")
+            self.assertIn("Accept-Encoding", response.headers["Vary"])
+            self.assertEqual(decompress(response.data), plain.data)
+            response.close()
+        plain.close()
+
+    def test_send_without_copy(self):
+        """It should send static files that have no compressed copy as they are"""
+        precompress_static(self.folder, MIMETYPES, min_size=100)
+        response = self.client.get("/static/css/tiny.css", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertIn("Accept-Encoding", response.headers["Vary"])
+        self.assertEqual(response.data, b"p{}")
+        response.close()
+        response = self.client.get("/static/newapp-icon.png", headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("Vary", response.headers)
+        response.close()
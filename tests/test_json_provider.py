@@ -0,0 +1,65 @@
+"""
+Test cases for the JSON Providers
+"""
+
+import json
+from datetime import date
+from decimal import Decimal
+from unittest import TestCase
+from unittest.mock import patch
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+from service.common.json_provider import OrjsonProvider, init_json
+
+DOCUMENT = {"b": [1, 2.5, None, True], "a": "café", "3": Decimal("1.10"), "day": date(2024, 3, 1)}
+
+
+######################################################################
+#  J S O N   P R O V I D E R   T E S T   C A S E S
+######################################################################
+class TestJsonProvider(TestCase):
+    """JSON Provider Tests"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config["JSON_PROVIDER"] = "auto"
+
+    def test_init_json(self):
+        """It should use orjson when it is installed unless told otherwise"""
+        init_json(self.app)
+        self.assertIsInstance(self.app.json, OrjsonProvider)
+        self.app.config["JSON_PROVIDER"] = "stdlib"
+        init_json(self.app)
+        self.assertNotIsInstance(self.app.json, OrjsonProvider)
+        self.app.config["JSON_PROVIDER"] = "simplejson"
+        self.assertRaises(ValueError, init_json, self.app)
+
+    def test_init_json_without_orjson(self):
+        """It should fall back to the standard library without orjson"""
+        self.app.config["JSON_PROVIDER"] = "orjson"
+        with patch("service.common.json_provider.orjson", None):
+            with self.assertLogs(self.app.logger, "WARNING"):
+                init_json(self.app)
+        self.assertNotIsInstance(self.app.json, OrjsonProvider)
+
+    def test_same_documents(self):
+        """It should encode documents like the standard library provider"""
+        fast, default = OrjsonProvider(self.app), DefaultJSONProvider(self.app)
+        self.assertEqual(
+            fast.dumps(DOCUMENT),
+            default.dumps(DOCUMENT, separators=(",", ":"), ensure_ascii=False),
+        )
+        self.assertEqual(fast.loads(fast.dumps(DOCUMENT)), default.loads(default.dumps(DOCUMENT)))
+        self.assertEqual(fast.loads(b'{"a": [1]}'), {"a": [1]})
+        self.assertEqual(fast.loads(fast.dumps({1: "a"})), default.loads(default.dumps({1: "a"})))
+
+    def test_response(self):
+        """It should build compact or indented JSON responses"""
+        fast = OrjsonProvider(self.app)
+        with self.app.app_context():
+            response = fast.response(DOCUMENT)
+            self.assertEqual(response.mimetype, "application/json")
+            self.assertEqual(response.get_data(as_text=True), fast.dumps(DOCUMENT) + "\n")
+            self.assertEqual(json.loads(response.get_data())["a"], "café")
+            fast.compact = False
+            self.assertIn('\n  "3": "1.10"', fast.response(DOCUMENT).get_data(as_text=True))
@@ -0,0 +1,134 @@
+"""
+Test cases for the Log Handlers
+"""
+
+import io
+import json
+import logging
+import queue
+import threading
+from unittest import TestCase
+from flask import Flask
+from service.common.log_handlers import init_logging, DroppingQueueHandler
+
+SETTINGS = {"LOG_FORMAT": "json", "LOG_ASYNC": True, "LOG_QUEUE_SIZE": 100, "LOG_SAMPLE_RATES": {}}
+
+
+######################################################################
+#  L O G G I N G   T E S T   C A S E S
+######################################################################
+class TestLogging(TestCase):
+    """Log Pipeline Tests"""
+
+    def setUp(self):
+        self.stream = io.StringIO()
+        gunicorn_logger = logging.getLogger(f"test.gunicorn.{self.id()}")
+        gunicorn_logger.setLevel(logging.INFO)
+        gunicorn_logger.addHandler(logging.StreamHandler(self.stream))
+        self.gunicorn_logger = gunicorn_logger
+
+    def create_app(self, **settings) -> Flask:
+        """Returns an app whose logging was set up with some settings"""
+        app = Flask(__name__)
+        app.config.update(SETTINGS, **settings)
+
+        @app.route("/")
+        def index():
+            app.logger.info("Listing %s", "wishlists")
+            app.logger.warning("Running late")
+            return ""
+
+        init_logging(app, self.gunicorn_logger.name)
+        return app
+
+    def lines(self, app) -> list:
+        """Returns what was logged once the queue was written out"""
+        if "log_listener" in app.extensions:
+            app.extensions["log_listener"].queue.join()
+        return self.stream.getvalue().splitlines()
+
+    def test_json_with_request_id(self):
+        """It should write JSON lines with the id of the request off the request thread"""
+        app = self.create_app()
+        response = app.test_client().get("/", headers={"X-Request-ID": "abc-123"})
+        self.assertEqual(response.headers["X-Request-ID"], "abc-123")
+        entries = [json.loads(line) for line in self.lines(app)]
+        self.assertEqual(entries[0]["message"], "Logging handler established")
+        self.assertNotIn("request_id", entries[0])
+        self.assertEqual(entries[1]["message"], "Listing wishlists")
+        self.assertEqual(entries[1]["level"], "INFO")
+        self.assertEqual(entries[1]["request_id"], "abc-123")
+        self.assertEqual(entries[2]["level"], "WARNING")
+
+    def test_new_request_id(self):
+        """It should give a new id to the requests that come without a valid one"""
+        app = self.create_app()
+        response = app.test_client().get("/", headers={"X-Request-ID": "not an id"})
+        self.assertEqual(len(response.headers["X-Request-ID"]), 32)
+        self.assertNotEqual(response.headers["X-Request-ID"], "not an id")
+
+    def test_sampling(self):
+        """It should keep only the sampled fraction of a level"""
+        app = self.create_app(LOG_SAMPLE_RATES={"info": 0.0})
+        app.test_client().get("/")
+        messages = [json.loads(line)["message"] for line in self.lines(app)]
+        self.assertEqual(messages, ["Running late"])
+
+    def test_synchronous_text(self):
+        """It should write text lines straight to the handlers when asked to"""
+        app = self.create_app(LOG_FORMAT="text", LOG_ASYNC=False)
+        self.assertNotIn("log_listener", app.extensions)
+        app.test_client().get("/")
+        lines = self.lines(app)
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].endswith("[INFO] [test_log_handlers] Listing wishlists"))
+
+    def test_exception(self):
+        """It should write the traceback of an exception in the JSON line, with or without the queue"""
+        for log_async in (True, False):
+            with self.subTest(log_async=log_async):
+                app = self.create_app(LOG_ASYNC=log_async)
+                try:
+                    raise ValueError("bad wishlist")
+                except ValueError:
+                    app.logger.exception("Failed")
+                entry = json.loads(self.lines(app)[-1])
+                self.assertEqual(entry["message"], "Failed")
+                self.assertIn("ValueError: bad wishlist", entry["exception"])
+
+    def test_format_on_listener(self):
+        """It should leave the formatting of the queued records to the listener thread"""
+        formatted_on = []
+
+        class Wishlist:  # pylint: disable=too-few-public-methods
+            """Remembers which thread rendered it"""
+
+            def __str__(self):
+                formatted_on.append(threading.current_thread())
+                return "wishlist"
+
+        app = self.create_app()
+        app.logger.info("Creating %s", Wishlist())
+        self.assertEqual(json.loads(self.lines(app)[-1])["message"], "Creating wishlist")
+        self.assertNotIn(threading.current_thread(), formatted_on)
+
+
+######################################################################
+#  Q U E U E   T E S T   C A S E S
+######################################################################
+class TestDroppingQueueHandler(TestCase):
+    """Bounded Log Queue Tests"""
+
+    def test_drop_when_full(self):
+        """It should drop the records that do not fit and then say how many"""
+        handler = DroppingQueueHandler(queue.Queue(1))
+        for number in range(3):
+            handler.handle(logging.makeLogRecord({"msg": f"record {number}", "levelno": logging.INFO}))
+        self.assertEqual(handler.dropped, 2)
+        self.assertEqual(handler.queue.get_nowait().getMessage(), "record 0")
+        handler.handle(logging.makeLogRecord({"msg": "record 3", "levelno": logging.INFO}))
+        # the warning took the only room there was
+        self.assertEqual(handler.dropped, 1)
+        warning = handler.queue.get_nowait()
+        self.assertEqual(warning.levelno, logging.WARNING)
+        self.assertEqual(warning.getMessage(), "Dropped 2 log records while the log queue was full")
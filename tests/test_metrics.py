@@ -0,0 +1,141 @@
+# pylint: disable=R0801
+"""
+Test cases for the Request Metrics
+"""
+
+import logging
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+from sqlalchemy import exc, text as sql
+from wsgi import app
+from service.common import status
+from service.common.cache import cache
+from service.common.metrics import metrics, Metrics, format_labels, merge
+from service.common.statement_timing import STARTED
+from service.models import db, Wishlist
+from tests.factories import WishlistFactory
+
+BASE_URL = "/wishlists"
+LABELS = (("method", "GET"), ("route", "/wishlists"))
+
+
+######################################################################
+#  R E Q U E S T   T I M I N G   T E S T   C A S E S
+######################################################################
+class TestRequestTiming(TestCase):
+    """Request Timing Tests"""
+
+    @classmethod
+    def setUpClass(cls):
+        app.config["TESTING"] = True
+        app.logger.setLevel(logging.CRITICAL)
+        app.app_context().push()
+
+    def setUp(self):
+        self.client = app.test_client()
+        db.session.query(Wishlist).delete()
+        db.session.commit()
+        metrics.reset()
+
+    def tearDown(self):
+        db.session.remove()
+
+    def test_server_timing(self):
+        """It should send the phases of a listing in a Server-Timing header"""
+        WishlistFactory().create()
+        response = self.client.get(BASE_URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        phases = [entry.split(";")[0] for entry in response.headers["Server-Timing"].split(", ")]
+        self.assertEqual(phases, ["db", "orm", "serialize", "json", "total"])
+
+    def test_metrics(self):
+        """It should count the requests of every route for Prometheus"""
+        self.client.get(BASE_URL)
+        self.client.get(f"{BASE_URL}/0")
+        self.client.get("/nowhere")
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.content_type.startswith("text/plain; version=0.0.4"))
+        text = response.get_data(as_text=True)
+        self.assertIn('http_requests_total{method="GET",route="/wishlists",status="200"} 1', text)
+        self.assertIn('http_requests_total{method="GET",route="/wishlists/<int:wishlist_id>",status="404"} 1', text)
+        self.assertIn('http_requests_total{method="GET",route="unmatched",status="404"} 1', text)
+        self.assertIn('http_request_duration_seconds_bucket{method="GET",route="/wishlists",le="+Inf"} 1', text)
+        self.assertIn('db_queries_total{method="GET",route="/wishlists"} 1', text)
+        self.assertIn("# TYPE http_request_duration_seconds histogram", text)
+
+    def test_cache_metrics(self):
+        """It should count the hits and misses of the payload cache for Prometheus"""
+        with patch.dict(app.config, {"CACHE_ENABLED": True}):
+            cache.init_app(app)
+        self.addCleanup(cache.init_app, app)
+        wishlist = WishlistFactory()
+        wishlist.create()
+        self.client.get(f"{BASE_URL}/{wishlist.id}")
+        self.client.get(f"{BASE_URL}/{wishlist.id}")
+        text = self.client.get("/metrics").get_data(as_text=True)
+        self.assertIn("cache_hits_total 1", text)
+        self.assertIn("cache_misses_total 1", text)
+        self.assertIn("cache_entries 1", text)
+        self.assertIn("# TYPE cache_entries gauge", text)
+
+    def test_failed_statement(self):
+        """It should forget the start of a statement that fails"""
+        with db.engine.connect() as connection:
+            with self.assertRaises(exc.DBAPIError):
+                connection.execute(sql("SELECT nothing FROM nowhere"))
+            self.assertEqual(connection.info[STARTED], [])
+
+    def test_metrics_disabled(self):
+        """It should not serve metrics when they are disabled"""
+        with patch.object(metrics, "enabled", False):
+            response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+######################################################################
+#  M E T R I C S   T E S T   C A S E S
+######################################################################
+class TestMetrics(TestCase):
+    """Metrics Registry Tests"""
+
+    def test_histogram(self):
+        """It should count every request in the buckets it fits in"""
+        registry = Metrics(buckets=(0.1, 1.0))
+        for seconds in (0.05, 0.5, 2.0):
+            registry.record(LABELS, 200, seconds, {"db": seconds / 2}, 1)
+        text = registry.render()
+        self.assertIn('http_request_duration_seconds_bucket{method="GET",route="/wishlists",le="0.1"} 1', text)
+        self.assertIn('http_request_duration_seconds_bucket{method="GET",route="/wishlists",le="1.0"} 2', text)
+        self.assertIn('http_request_duration_seconds_count{method="GET",route="/wishlists"} 3', text)
+        self.assertIn('http_request_duration_seconds_sum{method="GET",route="/wishlists"} 2.55', text)
+        self.assertIn('http_request_phase_seconds_total{method="GET",route="/wishlists",phase="db"} 1.275', text)
+
+    def test_shared_directory(self):
+        """It should add up the counts of every worker that writes to the directory"""
+        with tempfile.TemporaryDirectory() as directory:
+            workers = [Metrics(), Metrics()]
+            for worker in workers:
+                worker.directory = directory
+                worker.record(LABELS, 200, 0.01, {}, 2)
+            # the first worker has not flushed its counts yet
+            self.assertIn('db_queries_total{method="GET",route="/wishlists"} 2', workers[1].render())
+            workers[0].flush()
+            self.assertIn('db_queries_total{method="GET",route="/wishlists"} 4', workers[1].render())
+            for worker in workers:
+                worker.stop_flushing()
+            with open(f"{directory}/metrics-broken.json", "w", encoding="utf-8") as file:
+                file.write("{")
+            self.assertIn('http_requests_total{method="GET",route="/wishlists",status="200"} 2', workers[0].render())
+
+    def test_merge(self):
+        """It should merge the snapshots of workers"""
+        snapshot = {"counters": [], "histograms": [["h", [["route", "/"]], [1, 0.5, 1]]]}
+        merged = merge([snapshot, snapshot])
+        self.assertEqual(merged["histograms"], [["h", (("route", "/"),), [2, 1.0, 2]]])
+
+    def test_format_labels(self):
+        """It should escape the values of labels"""
+        self.assertEqual(format_labels([("route", 'a"b\\c\n')]), '{route="a\\"b\\\\c\\n"}')
+        self.assertEqual(format_labels([]), "")
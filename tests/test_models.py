@@ -6,10 +6,11 @@ Test cases for Pet Model
 
 import os
 import logging
+from datetime import date
 from unittest import TestCase
 from unittest.mock import patch
 from wsgi import app
-from service.models import Wishlist, Item, db, DataValidationError
+from service.models import Wishlist, Item, DuplicateJob, db, DataValidationError
 from .factories import ItemsFactory, WishlistFactory
 
 DATABASE_URI = os.getenv(
@@ -107,8 +108,65 @@ class TestWishlist(TestCase):
         wishlist = Wishlist.find(wishlist.id)
         self.assertEqual(wishlist.title, "Test Update Wishlist")
 
-    # def test_duplicate_wishlist(self):
-    #     """Should test if a wishlist was duplicated"""
+    def test_update_wishlist_version(self):
+        """It should change the version of a Wishlist only when it changes"""
+        wishlist = WishlistFactory()
+        wishlist.create()
+        version = Wishlist.find_version(wishlist.id)
+        self.assertEqual(version, 1)
+
+        wishlist.title = wishlist.title
+        wishlist.update()
+        self.assertEqual(Wishlist.find_version(wishlist.id), version)
+
+        wishlist.title = "Changed"
+        wishlist.update()
+        self.assertEqual(Wishlist.find_version(wishlist.id), version + 1)
+        self.assertIsNone(Wishlist.find_version(0))
+
+    def test_move_item_versions(self):
+        """It should change the version of both Wishlists when an item moves"""
+        source, target = WishlistFactory(), WishlistFactory()
+        source.items = [ItemsFactory(wishlist=source, id=None)]
+        source.create()
+        target.create()
+        versions = [Wishlist.find_version(w.id) for w in (source, target)]
+        item = Item.find(source.items[0].id)
+        item.wishlist_id = target.id
+        item.update()
+        self.assertGreater(Wishlist.find_version(source.id), versions[0])
+        self.assertGreater(Wishlist.find_version(target.id), versions[1])
+
+    def test_duplicate_wishlist(self):
+        """It should duplicate a wishlist and its items in the database"""
+        wishlist = WishlistFactory()
+        for _ in range(3):
+            wishlist.items.append(ItemsFactory(id=None, wishlist=wishlist))
+        wishlist.create()
+        new_id = Wishlist.duplicate(wishlist.id)
+        self.assertNotEqual(new_id, wishlist.id)
+        copy = Wishlist.find(new_id)
+        self.assertEqual(copy.title, wishlist.title + " COPY")
+        self.assertEqual(copy.user_id, wishlist.user_id)
+        self.assertEqual(copy.count, wishlist.count)
+        self.assertEqual(copy.version, 1)
+        self.assertEqual(
+            sorted(item.item_name for item in copy.items),
+            sorted(item.item_name for item in wishlist.items),
+        )
+        self.assertEqual(len(Item.all()), 6)
+
+    def test_duplicate_wishlist_not_found(self):
+        """It should not duplicate a wishlist that does not exist"""
+        self.assertIsNone(Wishlist.duplicate(0))
+        self.assertEqual(Wishlist.all(), [])
+
+    def test_duplicate_wishlist_failed(self):
+        """It should not duplicate a wishlist on database error"""
+        wishlist = WishlistFactory()
+        wishlist.create()
+        with patch("service.models.db.session.commit", side_effect=Exception()):
+            self.assertRaises(DataValidationError, Wishlist.duplicate, wishlist.id)
 
     @patch("service.models.db.session.commit")
     def test_update_wishlist_failed(self, exception_mock):
@@ -163,6 +221,18 @@ class TestWishlist(TestCase):
         wishlists = Wishlist.all()
         self.assertEqual(len(wishlists), 5)
 
+    def test_list_wishlists_paginated(self):
+        """It should List wishlists one keyset page at a time"""
+        for wish in WishlistFactory.create_batch(5):
+            wish.create()
+        first_page = Wishlist.all(limit=2)
+        self.assertEqual(len(first_page), 2)
+        rest = Wishlist.all(after=first_page[-1].id)
+        self.assertEqual(len(rest), 3)
+        ids = [w.id for w in first_page + rest]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(Wishlist.all(limit=2, after=ids[-1]), [])
+
     def test_find_by_title(self):
         """It should Find an wishlist by title"""
         wishlists = WishlistFactory.create_batch(10)
@@ -179,6 +249,38 @@ class TestWishlist(TestCase):
         self.assertEqual(same_wishlist.id, wishlist.id)
         self.assertEqual(same_wishlist.title, wishlist.title)
 
+    def test_find_by_user_id(self):
+        """It should Find the wishlists of a user"""
+        wishlists = WishlistFactory.create_batch(3, user_id=7)
+        wishlists.append(WishlistFactory(user_id=8))
+        for wishlist in wishlists:
+            wishlist.create()
+        found = Wishlist.find_by_user_id(7)
+        self.assertEqual(found.count(), 3)
+        self.assertTrue(all(wishlist.user_id == 7 for wishlist in found))
+
+    def test_find_by_title_prefix(self):
+        """It should Find wishlists by the start of their title, ignoring case"""
+        for title in ("Summer Trip", "summer_camp", "Summary", "100% cotton"):
+            WishlistFactory(title=title).create()
+        found = Wishlist.find_by_title_prefix("SUMMER")
+        self.assertCountEqual([w.title for w in found], ["Summer Trip", "summer_camp"])
+        self.assertEqual(Wishlist.find_by_title_prefix("summer_").count(), 1)
+        self.assertEqual(Wishlist.find_by_title_prefix("summ%").count(), 0)
+        self.assertEqual(Wishlist.find_by_title_prefix("100%").count(), 1)
+
+    def test_find_by_date_range(self):
+        """It should Find wishlists dated between two days"""
+        for day in (1, 10, 20):
+            WishlistFactory(date=date(2024, 3, day)).create()
+        self.assertEqual(
+            Wishlist.find_by_date_range(date(2024, 3, 10), date(2024, 3, 20)).count(), 2
+        )
+        self.assertEqual(Wishlist.find_by_date_range(start=date(2024, 3, 11)).count(), 1)
+        self.assertEqual(Wishlist.find_by_date_range(end=date(2024, 3, 10)).count(), 2)
+        query = Wishlist.find_by_date_range(end=date(2024, 3, 10))
+        self.assertEqual(Wishlist.find_by_date_range(date(2024, 3, 5), query=query).count(), 1)
+
     def test_serialize_a_wishlist(self):
         """It should Serialize an account"""
         wishlist = WishlistFactory()
@@ -196,6 +298,19 @@ class TestWishlist(TestCase):
         self.assertEqual(items[0]["item_name"], item.item_name)
         self.assertEqual(items[0]["wishlist_id"], item.wishlist_id)
 
+    def test_serialize_rows(self):
+        """It should Serialize a wishlist from Core rows like from the instance"""
+        wishlist = WishlistFactory()
+        wishlist.items = ItemsFactory.create_batch(3, wishlist=wishlist, id=None)
+        wishlist.create()
+        expected = wishlist.serialize()
+        expected["items"].sort(key=lambda item: item["id"])
+        payload = Wishlist.serialize_row(
+            Wishlist.find_row(wishlist.id), Item.find_rows_by_wishlist_id(wishlist.id)
+        )
+        self.assertEqual(payload, expected)
+        self.assertIsNone(Wishlist.find_row(0))
+
     def test_deserialize_a_wishlist(self):
         """It should Deserialize a wishlist"""
         wishlist = WishlistFactory()
@@ -219,6 +334,12 @@ class TestWishlist(TestCase):
         account = Wishlist()
         self.assertRaises(DataValidationError, account.deserialize, [])
 
+    def test_deserialize_with_value_error(self):
+        """It should not Deserialize a wishlist with a date that is not one"""
+        data = WishlistFactory().serialize()
+        data["date"] = "not-a-date"
+        self.assertRaises(DataValidationError, Wishlist().deserialize, data)
+
     def test_deserialize_item_key_error(self):
         """It should not Deserialize an item with a KeyError"""
         address = Item()
@@ -229,6 +350,16 @@ class TestWishlist(TestCase):
         address = Item()
         self.assertRaises(DataValidationError, address.deserialize, [])
 
+    def test_deserialize_duplicate_job(self):
+        """It should Deserialize a duplicate job"""
+        job = DuplicateJob().deserialize({"source_id": 7})
+        self.assertEqual(job.source_id, 7)
+        self.assertEqual(job.status, DuplicateJob.PENDING)
+        self.assertEqual(str(job), "None: 7 pending")
+        self.assertIn("DuplicateJob 7", repr(job))
+        self.assertRaises(DataValidationError, DuplicateJob().deserialize, {})
+        self.assertRaises(DataValidationError, DuplicateJob().deserialize, [])
+
     ######################################################################
     #  T E S T   C A S E S
     ######################################################################
@@ -302,6 +433,20 @@ class TestWishlist(TestCase):
         self.assertEqual(new_item.wishlist_id, item.wishlist_id)
         self.assertEqual(new_item.item_name, item.item_name)
 
+    def test_find_items_by_wishlist_id(self):
+        """It should Find the items of a wishlist"""
+        wishlist = WishlistFactory()
+        wishlist.items = ItemsFactory.create_batch(3, wishlist=wishlist)
+        wishlist.create()
+        other = WishlistFactory()
+        other.items = [ItemsFactory(wishlist=other)]
+        other.create()
+        found = Item.find_by_wishlist_id(wishlist.id)
+        self.assertEqual(found.count(), 3)
+        page = Item.paginate(found, limit=2).all()
+        self.assertEqual(len(page), 2)
+        self.assertTrue(all(item.wishlist_id == wishlist.id for item in page))
+
     def test_delete_wishlist_item(self):
         """It should Delete a wishlists item"""
         wishlists = Wishlist.all()
@@ -0,0 +1,105 @@
+"""
+Test cases for Connection Pool Statistics
+"""
+
+import sqlite3
+import threading
+import time
+from unittest import TestCase
+from flask import Flask
+from sqlalchemy import create_engine, exc
+from sqlalchemy.pool import StaticPool
+from service.common.pool import MonitoredQueuePool, init_pool, pool_stats
+
+
+######################################################################
+#  P O O L   T E S T   C A S E S
+######################################################################
+class TestMonitoredQueuePool(TestCase):
+    """Monitored Queue Pool Tests"""
+
+    def setUp(self):
+        self.pool = MonitoredQueuePool(
+            lambda: sqlite3.connect(":memory:", check_same_thread=False),
+            pool_size=1,
+            max_overflow=1,
+            timeout=0.05,
+        )
+        self.addCleanup(self.pool.dispose)
+
+    def test_no_waits(self):
+        """It should not count checkouts that find a connection"""
+        first = self.pool.connect()
+        second = self.pool.connect()
+        stats = self.pool.stats()
+        self.assertEqual(stats["checked_out"], 2)
+        self.assertEqual(stats["overflow"], 1)
+        self.assertEqual(stats["waits"], 0)
+        first.close()
+        second.close()
+        stats = self.pool.stats()
+        self.assertEqual(stats["checked_out"], 0)
+        self.assertEqual(stats["checked_in"], 1)
+        self.assertEqual(stats["overflow"], 0)
+
+    def test_timeout(self):
+        """It should count checkouts that time out waiting for a connection"""
+        held = [self.pool.connect(), self.pool.connect()]
+        self.assertRaises(exc.TimeoutError, self.pool.connect)
+        stats = self.pool.stats()
+        self.assertEqual(stats["waits"], 1)
+        self.assertEqual(stats["timeouts"], 1)
+        self.assertGreaterEqual(stats["wait_ms"], 50)
+        for connection in held:
+            connection.close()
+
+    def test_wait(self):
+        """It should count checkouts that wait for a connection to come back"""
+        self.pool._timeout = 5  # pylint: disable=protected-access
+        held = [self.pool.connect(), self.pool.connect()]
+        release = threading.Timer(0.05, held.pop().close)
+        release.start()
+        started = time.perf_counter()
+        connection = self.pool.connect()
+        self.assertGreaterEqual(time.perf_counter() - started, 0.04)
+        stats = self.pool.stats()
+        self.assertEqual(stats["waits"], 1)
+        self.assertEqual(stats["timeouts"], 0)
+        connection.close()
+        held.pop().close()
+
+    def test_other_pools(self):
+        """It should report only the kind of pools that are not monitored"""
+        engine = create_engine("sqlite://", poolclass=StaticPool)
+        stats = pool_stats(engine)
+        self.assertEqual(stats["pool"], "StaticPool")
+        self.assertNotIn("waits", stats)
+        engine.dispose()
+
+
+######################################################################
+#  C O N N E C T I O N   M O D E   T E S T   C A S E S
+######################################################################
+class TestInitPool(TestCase):
+    """Connection Mode Tests"""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config.update(
+            DB_CONNECTION_MODE="direct",
+            DB_STATEMENT_TIMEOUT=0,
+            SQLALCHEMY_ENGINE_OPTIONS={"pool_size": 5},
+        )
+
+    def test_init_pool(self):
+        """It should monitor QueuePools and reject unknown connection modes"""
+        init_pool(self.app)
+        self.assertIs(self.app.config["SQLALCHEMY_ENGINE_OPTIONS"]["poolclass"], MonitoredQueuePool)
+        self.app.config["DB_CONNECTION_MODE"] = "pooler"
+        self.assertRaises(ValueError, init_pool, self.app)
+
+    def test_pgbouncer_statement_timeout(self):
+        """It should warn that PgBouncer does not pass the statement timeout"""
+        self.app.config.update(DB_CONNECTION_MODE="pgbouncer", DB_STATEMENT_TIMEOUT=1000)
+        with self.assertLogs(self.app.logger, "WARNING"):
+            init_pool(self.app)
@@ -0,0 +1,114 @@
+"""
+Test cases for the Request Profiler
+"""
+
+import os
+import tempfile
+import time
+from collections import Counter
+from unittest import TestCase
+from flask import Flask
+from service.common.profiling import Profiler, merge_profiles, self_samples, slug
+
+
+def busy(seconds):
+    """Keeps the CPU busy for a while"""
+    finish = time.perf_counter() + seconds
+    while time.perf_counter() < finish:
+        pass
+
+
+######################################################################
+#  P R O F I L E R   T E S T   C A S E S
+######################################################################
+class TestProfiler(TestCase):
+    """Request Profiler Tests"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.app = Flask(__name__)
+        self.app.config.update(
+            PROFILE_SAMPLE_RATE=2,
+            PROFILE_SECRET="s3cret",
+            PROFILE_DIR=self.directory,
+            PROFILE_INTERVAL_MS=1,
+            PROFILE_MAX_FILES=3,
+        )
+
+        @self.app.route("/wishlists/<int:wishlist_id>")
+        def get_wishlist(wishlist_id):
+            busy(0.03)
+            return {"id": wishlist_id}
+
+        self.profiler = Profiler()
+        self.profiler.init_app(self.app)
+        self.client = self.app.test_client()
+
+    def profiles(self) -> list:
+        """Returns the names of the profiles that were written"""
+        return sorted(os.listdir(self.directory))
+
+    def test_sample_rate(self):
+        """It should profile 1 in every PROFILE_SAMPLE_RATE requests"""
+        for wishlist_id in range(4):
+            self.assertEqual(self.client.get(f"/wishlists/{wishlist_id}").status_code, 200)
+        profiles = self.profiles()
+        self.assertEqual(len(profiles), 2)
+        self.assertTrue(profiles[0].endswith("-GET-wishlists_int_wishlist_id.folded"))
+        count, stacks = merge_profiles(self.directory, "/wishlists/<int:wishlist_id>", "get")
+        self.assertEqual(count, 2)
+        self.assertTrue(any("TestProfiler.setUp.<locals>.get_wishlist;tests.test_profiling.busy" in stack
+                            for stack in stacks))
+
+    def test_secret_header(self):
+        """It should profile the requests that send the secret"""
+        self.profiler.rate = 0
+        self.client.get("/wishlists/1", headers={"X-Profile": "guess"})
+        self.assertEqual(self.profiles(), [])
+        self.client.get("/wishlists/1", headers={"X-Profile": "s3cret"})
+        self.assertEqual(len(self.profiles()), 1)
+
+    def test_max_files(self):
+        """It should keep only the latest PROFILE_MAX_FILES profiles"""
+        paths = [self.profiler.write(f"GET-route{number}", Counter({"a;b": 1})) for number in range(5)]
+        self.assertEqual(self.profiles(), [os.path.basename(path) for path in paths[2:]])
+
+    def test_disabled(self):
+        """It should not profile anything unless it is asked to"""
+        app = Flask(__name__)
+        app.config.update(
+            PROFILE_SAMPLE_RATE=0, PROFILE_SECRET="", PROFILE_DIR=self.directory,
+            PROFILE_INTERVAL_MS=1, PROFILE_MAX_FILES=3,
+        )
+        Profiler().init_app(app)
+        self.assertEqual(app.before_request_funcs, {})
+
+
+######################################################################
+#  M E R G E   T E S T   C A S E S
+######################################################################
+class TestMergeProfiles(TestCase):
+    """Profile Merging Tests"""
+
+    def test_merge(self):
+        """It should add up the stacks of the profiles of a route"""
+        with tempfile.TemporaryDirectory() as directory:
+            profiler = Profiler()
+            profiler.directory = directory
+            profiler.write("GET-wishlists", Counter({"main;list;serialize": 3, "main;list": 1}))
+            profiler.write("GET-wishlists", Counter({"main;list;serialize": 2}))
+            profiler.write("POST-wishlists", Counter({"main;create": 5}))
+            count, stacks = merge_profiles(directory, "/wishlists", "GET")
+            self.assertEqual(count, 2)
+            self.assertEqual(stacks, Counter({"main;list;serialize": 5, "main;list": 1}))
+            self.assertEqual(self_samples(stacks), Counter({"serialize": 5, "list": 1}))
+            with open(os.path.join(directory, "merged.folded"), "w", encoding="utf-8") as file:
+                file.write("main;list 1\n")
+            self.assertEqual(merge_profiles(directory)[0], 3)
+
+    def test_slug(self):
+        """It should turn URL rules into parts of file names"""
+        self.assertEqual(slug("/wishlists/<int:wishlist_id>/items"), "wishlists_int_wishlist_id_items")
+        self.assertEqual(slug("/"), "root")
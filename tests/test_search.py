@@ -0,0 +1,76 @@
+"""
+Test cases for the SQLite full text search fallback
+"""
+
+from unittest import TestCase
+from datetime import date
+from sqlalchemy import create_engine, insert, select
+from service.models import db, Wishlist, Item
+from service.models.search import fts5_query, search_matches
+
+WISHLISTS = Wishlist.__table__
+ITEMS = Item.__table__
+
+
+######################################################################
+#  S Q L I T E   S E A R C H   T E S T   C A S E S
+######################################################################
+class TestSqliteSearch(TestCase):
+    """SQLite FTS5 Search Tests"""
+
+    def setUp(self):
+        self.engine = create_engine("sqlite://")
+        db.metadata.create_all(self.engine)
+        self.conn = self.engine.connect()
+        for wishlist_id, title, description in (
+            (1, "Camping gear", "for the summer trip"),
+            (2, "Kitchen", "pots and pans"),
+            (3, "Books", "novels to read"),
+        ):
+            self.conn.execute(
+                insert(WISHLISTS).values(
+                    id=wishlist_id, user_id=1, title=title, description=description,
+                    count=0, date=date(2024, 3, 1),
+                )
+            )
+        for wishlist_id, item_name in (
+            (1, "camping tent"), (2, "camping stove"), (3, "tents for kids")
+        ):
+            self.conn.execute(insert(ITEMS).values(wishlist_id=wishlist_id, item_name=item_name))
+
+    def tearDown(self):
+        self.conn.close()
+        db.metadata.drop_all(self.engine)
+        self.engine.dispose()
+
+    def _search(self, terms):
+        """Returns the titles of the wishlists that match, best first"""
+        matches = search_matches("sqlite", WISHLISTS, ITEMS, terms)
+        statement = (
+            select(WISHLISTS.c.title)
+            .join(matches, matches.c.wishlist_id == WISHLISTS.c.id)
+            .order_by(matches.c.rank.desc(), WISHLISTS.c.id)
+        )
+        return list(self.conn.scalars(statement))
+
+    def test_search(self):
+        """It should rank Wishlists that match in several places first"""
+        self.assertEqual(self._search("camping"), ["Camping gear", "Kitchen"])
+        self.assertCountEqual(self._search("tents"), ["Camping gear", "Books"])
+        self.assertEqual(self._search("summer trip"), ["Camping gear"])
+        self.assertEqual(self._search("bicycle"), [])
+
+    def test_search_follows_changes(self):
+        """It should keep the index in step with updates and deletes"""
+        self.conn.execute(
+            WISHLISTS.update().where(WISHLISTS.c.id == 3).values(title="Camping books")
+        )
+        self.conn.execute(ITEMS.delete().where(ITEMS.c.wishlist_id == 2))
+        self.assertCountEqual(self._search("camping"), ["Camping gear", "Camping books"])
+        self.assertEqual(self._search("novels"), ["Camping books"])
+
+    def test_quote_terms(self):
+        """It should match FTS5 operators and quotes as plain words"""
+        self.assertEqual(fts5_query('tent OR "stove'), '"tent" "OR" """stove"')
+        self.assertEqual(self._search('kitchen" OR NEAR(pots'), [])
+        self.assertEqual(self._search("Kitchen pots"), ["Kitchen"])